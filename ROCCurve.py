@@ -1,303 +1,1004 @@
-'''
-ROC curve plotter 
-
-(c) Richard Pienaar - 2020
-University of Queensland  
-
-'''
-import ribbon
-import os
-import bed, sys, ival
-import csv
-
-def get_prefixes():
-    '''
-    Returns list [str,str..] of prefix names - experimental group
-
-    Works by going into the Test_data subfolder
-    '''
-    file_names = os.listdir(".\Test_data")
-    prefixes = []
-    for filename in file_names:
-        if filename.endswith('.bed'):
-            prefixes.append(filename[:-4])
-        else:
-            prefixes.append(filename)
-    return prefixes
-
-def total_bases(bfile):
-    '''
-    returns count(int) of number of bases in a bedfile (bed.Bedfile)
-    '''
-    count = 0
-    try:
-        for entry in bfile:
-            interval = entry.getInterval()
-            count+= len(interval)
-    except:
-        return 0
-    return count
-
-def count_entries(P,entry,T=True,metric='pValue'):
-    '''
-    Returns list of all overlapping regions of bedEntry (entry) in bedfile (P) as:
-     (Interval(interest of P and entry),metric,T)
-     where: 
-     metric = p.value or score
-     and T is whether its a True(T=True) or False(T=False) Positive entry   
-    '''
-    OlP = P.getOverlap(entry)
-    out = []
-    if metric == 'pValue':
-        if OlP != []:
-            for region in OlP:
-                out.append((ival.isect(region.getInterval(),entry.getInterval()), entry.pValue, T))
-    else:
-        if OlP != []:
-            for region in OlP:
-                out.append((ival.isect(region.getInterval(),entry.getInterval()), entry.score, T))
-    return out
-
-def get_points_to_plot(TP,TN,FP,FN,test,all,name2,bybase=True,precise=True):
-    '''
-    calculates points for ROC curve plotting and returns them as xs, ys [float,float,...]
-    TP (bfile) --> True Positives
-    TN (bfile) --> True Negatives
-    FP (bfile) --> False Positives
-    FN (bfile) --> False Negatives
-    all (bfile) --> All test data
-    name2 (str) --> name of the experimental group
-    bybase (bool) --> calc by base or by peak
-    precise (bool) --> Reports every single base when True, otherwise collapses:
-                - e.g if the region 80-86 is all Tp, precise True returns x.y values corresponding to 
-                - 80,81,82,83,84,85,86 whereas i precise is False only the vx,y values of 80 and 86 are returned (the inbetween can be inferred) 
-    '''
-    empty = total_bases(FN) # check for fully encompassing test data
-    if bybase:
-        YDENOM = total_bases(TP)+total_bases(FN) 
-        XDENOM = total_bases(FP)+total_bases(TN)
-    else:
-        YDENOM=0
-        XDENOM=0
-
-        for entry in all:
-            if TP.getOverlap(entry) != []:
-                YDENOM+=1
-            elif empty != 0:
-                if FN.getOverlap(entry) != []:
-                    YDENOM+=1
-                else:
-                    XDENOM+=1
-            else:
-                XDENOM+=1
-    data = [] # each entry - presort
-    # for graphing
-    ysum = 0 
-    xsum = 0
-    ys = []
-    xs = []
-
-    if bybase:
-        for entry in test: # calculating values to graph
-            TPs = count_entries(TP,entry,metric='pValue')
-            FPs = count_entries(FP,entry,False,metric='pValue')
-            for ol in TPs:
-                data.append(ol)
-            for ol in FPs:
-                data.append(ol)
-        
-        # sort by T/F 
-        data.sort(key = lambda data: data[2])
-        
-        # Correction for overlaps overlapping due to the way ival.py works
-        i =0
-        while True:
-            
-            try:
-                inter = ival.isect(data[i][0],data[i+1][0])
-                if inter != None :
-                    data.append((ival.isect(data[i][0],data[i+1][0]),data[i][1],data[i][2]))
-                    data.remove(data[i])
-                    data.remove(data[i+1])
-                else:
-                    i+=1
-            except:
-                break
-    else:
-        for entry in test: # calculating values to graph
-            data.append((entry, entry.pValue))
-            
-    if 'idr' in name2.lower():
-        data.sort(key = lambda data: data[1], reverse=True) 
-    else:
-        data.sort(key = lambda data: data[1])
-
-    if bybase:
-        if not precise:
-
-            for zone in data:
-                if zone[2]: # True Positive
-                    ysum+= len(zone[0])
-                else: # False Positive
-                    xsum+= len(zone[0])
-                ys.append(ysum / YDENOM)
-                xs.append(xsum / XDENOM)    
-        
-        else: # EVERY DATA POINT
-            for zone in data: 
-                if zone[2]: # True Positive
-                    oldsum = ysum
-                    while ysum < (oldsum+ len(zone[0])):
-                        ysum+= 1
-                        xs.append(xsum / XDENOM)
-                        ys.append(ysum / YDENOM)
-                else: # False Positive
-                    oldsum = xsum
-                    while xsum < (oldsum + len(zone[0])):
-                        xsum+=1
-                        xs.append(xsum / XDENOM)
-                        ys.append(ysum / YDENOM)
-    else:
-        for zone in data:
-            if TP.getOverlap(zone[0]) != []:
-                ysum+=1
-            else:
-                xsum+=1
-            ys.append(ysum / YDENOM)
-            xs.append(xsum / XDENOM) 
-    
-    return xs,ys
-
-def save_csv(name,points):
-    '''
-    Saves ROC points (from get_points_to_plot()) as csv for parsing later
-    FIXME: Maybe make not to the general directory
-    '''
-    with open(name+'.csv', 'w',newline='') as csvfile:
-        spamwriter = csv.writer(csvfile, delimiter=',',dialect='excel')
-        for e in range(len(points[0])):
-            spamwriter.writerow([points[0][e],points[1][e]])
-        csvfile.close() 
-
-def assert_data(True_Pos,True_Neg,All,False_pos,False_Neg):
-    '''
-    True if bedtools operations have been performed successfully
-    True_Pos,True_Neg,All,False_pos,False_Neg - <bed.Bedfile>
-    '''
-    # checks files are correct (no base is labelled twice)
-    if total_bases(True_Pos)+total_bases(True_Neg)+total_bases(False_pos)+total_bases(False_Neg)-total_bases(All) == 0:
-        return True
-    else:
-        # debug
-        print(total_bases(True_Pos), total_bases(True_Neg), total_bases(False_pos), total_bases(False_Neg), total_bases(All))
-        print(total_bases(True_Pos)+total_bases(True_Neg)+total_bases(False_pos)+total_bases(False_Neg)-total_bases(All))
-        return False
-
-def largest_test_set(prefixes):
-    '''
-    Returns <bed.BedFile> the largest test data set, must be all encompasaing i.e every point is labelled
-    '''
-    winner = 0
-    winnerfile = None
-    for expgroup in prefixes: 
-        try:
-            file = bed.BedFile(".\Test_data\\"+str(expgroup)+".bed",format='Peaks')
-        except:
-            file = bed.BedFile(".\Test_data\\"+str(expgroup)+".bed",format='idr')
-        
-        winningcount = total_bases(file)
-        if winningcount > winner:
-            winnerfile = file
-            winner = winningcount
-
-    return winnerfile
-
-def name_groups(prefixes):
-    '''
-    Request user input on the exact name of each experimental group, for graphing
-    returns [str,str,str..] - the names 
-    '''
-    names =[]
-    for pref in prefixes:
-        names.append(input('Please specify this groups full name '+str(pref)+" : "))
-    return names
-
-def main():
-    '''
-    Generates ROC curves from bedfiles (.bed)
-    Assuming correct folder management, should return comparitive ribbon plots of all the .bed files of each experimental group in the required subdirectories
-    ''' 
-    # file management stuff
-    prefixes = get_prefixes()
-    names = name_groups(prefixes) # full names for graphing 
-    runs = os.listdir(".\True_Positives")
-    Directorynames= [".\True_Positives",".\False_Positives",".\True_Negatives",".\False_Negatives"]
-    all = [] # used to infer the appropriate grouping for each run 
-
-    # check for existence of csv files already
-    try:
-        ribbon.ribbon(prefixes,names)
-    
-    except: 
-        print('loading bed files - General')
-        for prefix in prefixes:
-            try:
-                all.append(bed.BedFile('.\Test_Data\\'+str(prefix)+'.bed',format='Peaks'))
-            except:
-                all.append(bed.BedFile('.\Test_Data\\'+str(prefix)+'.bed',format='idr'))
-
-        # loading file steps
-        for expgroup in prefixes:
-            TPs,FPs,TNs,FNs = [],[],[],[]
-            print('loading bed files - '+str(expgroup))
-            for subdir in Directorynames:
-                for bfile in runs: 
-                    if str(expgroup) == str(bfile)[0:len(str(expgroup))] and str(bfile)[len(str(expgroup))] == '_':
-                        print(str(subdir)+"\\"+str(bfile))
-                        if 'idr' not in str(expgroup).lower():
-                            if subdir == Directorynames[0]:
-                                TPs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='Peaks'))
-                            elif subdir == Directorynames[1]:
-                                FPs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='Peaks'))
-                            elif subdir == Directorynames[2]:
-                                TNs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='Peaks'))
-                            else:
-                                FNs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='Peaks'))
-                        else:
-                            if subdir == Directorynames[0]:
-                                TPs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='idr'))
-                            elif subdir == Directorynames[1]:
-                                FPs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='idr'))
-                            elif subdir == Directorynames[2]:
-                                try:
-                                    TNs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='idr')) # check for basic data - resulting from bedtools
-                                except:
-                                    TNs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='simple'))
-                            else:
-                                try:
-                                    FNs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='idr'))              
-                                except:
-                                    FNs.append(bed.BedFile(str(subdir)+"\\"+str(bfile),format='simple'))              
-
-            try:
-                test = bed.BedFile(".\Test_data\\"+str(expgroup)+".bed",format='Peaks')
-            except:
-                test = bed.BedFile(".\Test_data\\"+str(expgroup)+".bed",format='idr')
-            
-            # Calculation steps
-            for i in range(len(TPs)):
-                for possibility in all:
-                    if assert_data(TPs[i],TNs[i],possibility,FPs[i],FNs[i]):
-                        print('calculating points - Peak level', str(expgroup), str(i))
-                        points = get_points_to_plot(TPs[i],TNs[i],FPs[i],FNs[i],test,possibility,expgroup,bybase=False) # Peak level
-                        save_csv(str(expgroup)+"_"+str(i)+'Peaks',points) # write output to csv
-                        
-                        print('calculating points - Base level', str(expgroup), str(i))
-                        points = get_points_to_plot(TPs[i],TNs[i],FPs[i],FNs[i],test,possibility,expgroup,bybase=True,precise=True) # Base level
-                        save_csv(str(expgroup)+"_"+str(i)+'Bases',points) # write output to csv
-
-        ribbon.ribbon(prefixes,names) # Graph curves with newly generated data
-
-
-if __name__ == "__main__": 
-    main()
+'''
+ROC curve plotter 
+
+(c) Richard Pienaar - 2020
+University of Queensland  
+
+'''
+import ribbon, metrics, instrument
+import os
+import bed, sys, ival
+import csv, heapq
+import argparse, concurrent.futures, functools, tempfile, json, hashlib, re
+import numpy as np
+
+def get_prefixes(root='.'):
+    '''
+    Returns list [str,str..] of prefix names - experimental group
+
+    Works by going into the Test_data subfolder of root (str)
+    '''
+    file_names = sorted(os.listdir(os.path.join(root,'Test_data')))
+    prefixes = []
+    for filename in file_names:
+        if filename.endswith('.npz'): # binary cache of a parsed bed file
+            continue
+        if filename.endswith('.bed'):
+            prefixes.append(filename[:-4])
+        else:
+            prefixes.append(filename)
+    return prefixes
+
+loaded_beds = {} # load_bed() results of this process, by file and options
+
+def load_bed(filename,formats=('Peaks','idr'),backend='columnar',cache=True):
+    '''
+    Returns <bed.BedFile> of filename (str), parsed with the first of formats [str,str..] that succeeds
+    backend (str) --> see bed.BedFile
+    cache (bool) --> re-use the binary cache of the parsed file kept next to it (bed.BedFile(cache=True))
+    Each file is only loaded once per process, later calls return the same <bed.BedFile> until release_beds()
+    '''
+    key = (filename, tuple(formats), backend, cache)
+    if key in loaded_beds:
+        return loaded_beds[key]
+    with instrument.stage('parse', file=filename) as parsing:
+        for format in formats[:-1]:
+            try:
+                loaded_beds[key] = bed.BedFile(filename,format=format,backend=backend,cache=cache)
+                break
+            except:
+                pass
+        else:
+            loaded_beds[key] = bed.BedFile(filename,format=formats[-1],backend=backend,cache=cache)
+        parsing.items = len(loaded_beds[key])
+    return loaded_beds[key]
+
+def release_beds(files):
+    '''
+    Drops the load_bed() results of files [(filename,formats),..] kept by this process, e.g. the partition of a
+    replicate once it is used - the test sets are shared by the replicates and stay loaded
+    '''
+    filenames = set(filename for filename, formats in files)
+    for key in [key for key in loaded_beds if key[0] in filenames]:
+        del loaded_beds[key]
+
+def total_bases(bfile):
+    '''
+    returns count(int) of number of bases in a bedfile (bed.Bedfile)
+    Overlapping entries are counted once for each entry, the count is kept by the bedfile (bed.BedFile.stats())
+    '''
+    return bfile.stats()['bases']
+
+def covered_bases(*bfiles):
+    '''
+    returns count(int) of the bases covered by any of the bedfiles (bed.BedFile), overlaps counted once (bed.BedFile.union())
+    '''
+    return bed.intervalBases(bfiles[0].union(*bfiles[1:]))
+
+def count_entries(P,entry,T=True,metric='pValue'):
+    '''
+    Returns list of all overlapping regions of bedEntry (entry) in bedfile (P) as:
+     (Interval(interest of P and entry),metric,T)
+     where: 
+     metric = p.value or score
+     and T is whether its a True(T=True) or False(T=False) Positive entry   
+    '''
+    OlP = P.getOverlap(entry)
+    out = []
+    if OlP:
+        value = getattr(entry, metric)
+        for region in OlP:
+            out.append((ival.isect(region.getInterval(),entry.getInterval()), value, T))
+    return out
+
+def intervals_by_chrom(bfile,metric=None,ascending=True):
+    '''
+    Returns dict {chrom: [(start,end),..]} of the entries of a bedfile (bed.BedFile)
+    metric (str) --> when given, each tuple also carries that field of the entry i.e (start,end,metric), see bed.BedFile.scores()
+    ascending (bool) --> with metric, the metric is negated when False, so that lower values are always ranked first
+    '''
+    out = {}
+    scores = bfile.scores(metric) if metric is not None else None
+    for chrom in bfile.chroms:
+        columns = bfile.columns(chrom)
+        if metric is None:
+            out[chrom] = list(zip(columns.starts.tolist(), columns.ends.tolist()))
+        elif chrom in scores:
+            keys = scores[chrom] if ascending else -scores[chrom]
+            out[chrom] = list(zip(columns.starts.tolist(), columns.ends.tolist(), keys.tolist()))
+    return out
+
+def sweep_chrom(test,TPs,FPs):
+    '''
+    Single sweep over the sorted boundaries of one chromosome
+    test [(start,end,key),..] --> test entries, lower key = ranked earlier
+    TPs, FPs [(start,end),..] --> true and false positive regions
+    returns [(key,tp_bases,fp_bases),..] - one segment per stretch of bases with a constant labelling,
+    where key is the best ranked test entry covering those bases (each base is counted once)
+    '''
+    events = []
+    for start, end, key in test:
+        if end > start:
+            events.append((start, 0, key))
+            events.append((end, 1, key))
+    for start, end in TPs:
+        if end > start:
+            events.append((start, 2, 1))
+            events.append((end, 2, -1))
+    for start, end in FPs:
+        if end > start:
+            events.append((start, 3, 1))
+            events.append((end, 3, -1))
+    events.sort()
+
+    active = [] # heap of keys of the test entries covering the sweep position
+    closed = {} # keys waiting to be lazily removed from the heap
+    tpdepth = 0
+    fpdepth = 0
+    prev = None
+    out = []
+    for pos, kind, value in events:
+        if prev is not None and pos > prev and active and (tpdepth or fpdepth):
+            out.append((active[0], pos - prev if tpdepth else 0, pos - prev if fpdepth else 0))
+        if kind == 0:
+            heapq.heappush(active, value)
+        elif kind == 1:
+            closed[value] = closed.get(value, 0) + 1
+            while active and closed.get(active[0], 0):
+                closed[active[0]] -= 1
+                heapq.heappop(active)
+        elif kind == 2:
+            tpdepth += value
+        else:
+            fpdepth += value
+        prev = pos
+    return out
+
+def sweep_segments(TP,FP,test,metric='pValue',ascending=True,jobs=1):
+    '''
+    Sweep-line replacement for counting overlaps entry by entry
+    Sorts the TP, FP and test (bed.BedFile) intervals per chromosome once and merges them in a single sweep
+    metric (str) --> field of the test entries used to rank them, see bed.BedFile.scores()
+    ascending (bool) --> rank the lowest metric first, the highest first (e.g. IDR output) otherwise
+    jobs (int) --> number of worker processes sweeping chromosomes at the same time (see sweep_chrom_arrays()), the
+                   per chromosome counts are merged by metric value at the end
+    returns keys, tps, fps <numpy.array> - per distinct metric value (in ranking order) the number of TP and FP bases
+    '''
+    if jobs > 1 and len(test.chroms) > 1:
+        scores = test.scores(metric)
+        chromtasks = []
+        for chrom in scores:
+            columns = test.columns(chrom)
+            keys = scores[chrom] if ascending else -scores[chrom]
+            chromtasks.append([(columns.starts, columns.ends, keys)])
+            for bfile in (TP, FP):
+                other = bfile.columns(chrom) if chrom in bfile.chroms else None
+                chromtasks[-1].append((other.starts, other.ends) if other is not None else None)
+        chromtasks.sort(key=lambda chromtask: -len(chromtask[0][0])) # largest chromosomes first
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            parts = list(executor.map(sweep_chrom_arrays, chromtasks))
+        keys, tps, fps = merge_segments(parts)
+    else:
+        tests = intervals_by_chrom(test, metric, ascending)
+        TPs = intervals_by_chrom(TP)
+        FPs = intervals_by_chrom(FP)
+        segments = []
+        for chrom in sorted(tests.keys()):
+            segments.extend(sweep_chrom(tests[chrom], TPs.get(chrom, []), FPs.get(chrom, [])))
+        keys, tps, fps = aggregate_segments(segments)
+    if not ascending:
+        keys = -keys
+    return keys, tps, fps
+
+def sweep_chrom_arrays(chromtask):
+    '''
+    sweep_chrom() for the intervals of one chromosome given as arrays - run by sweep_segments() in worker processes
+    chromtask (list) --> [(starts,ends,keys) of the test entries, (starts,ends) of the TPs or None, same for the FPs]
+    returns keys, tps, fps <numpy.array> of the chromosome, see aggregate_segments()
+    '''
+    (starts, ends, keys), TPs, FPs = chromtask
+    ranked = list(zip(starts.tolist(), ends.tolist(), keys.tolist()))
+    tpivs = list(zip(TPs[0].tolist(), TPs[1].tolist())) if TPs is not None else []
+    fpivs = list(zip(FPs[0].tolist(), FPs[1].tolist())) if FPs is not None else []
+    return aggregate_segments(sweep_chrom(ranked, tpivs, fpivs))
+
+def merge_segments(parts):
+    '''
+    Merges the keys, tps, fps <numpy.array> of several chromosomes (from aggregate_segments()) into one, summed per key
+    '''
+    parts = [part for part in parts if len(part[0]) > 0]
+    if not parts:
+        return aggregate_segments([])
+    keys = np.concatenate([part[0] for part in parts])
+    tps = np.concatenate([part[1] for part in parts])
+    fps = np.concatenate([part[2] for part in parts])
+    order = np.argsort(keys, kind='stable')
+    keys, starts = np.unique(keys[order], return_index=True)
+    return keys, np.add.reduceat(tps[order], starts), np.add.reduceat(fps[order], starts)
+
+def aggregate_segments(segments):
+    '''
+    Sums the segments [(key,tp_bases,fp_bases),..] (from sweep_chrom()) per key
+    returns keys, tps, fps <numpy.array> - sorted by key
+    '''
+    if not segments:
+        return np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    segments = np.array(segments, dtype=float)
+    order = np.argsort(segments[:, 0], kind='stable')
+    segments = segments[order]
+    keys, starts = np.unique(segments[:, 0], return_index=True)
+    tps = np.add.reduceat(segments[:, 1], starts).astype(np.int64)
+    fps = np.add.reduceat(segments[:, 2], starts).astype(np.int64)
+    return keys, tps, fps
+
+def points_from_segments(segments,XDENOM,YDENOM,precise=True):
+    '''
+    Turns the output of sweep_segments() into ROC points xs, ys <numpy.array>
+    For every metric value the FP bases are walked before the TP bases (ties are not credited early)
+    precise (bool) --> one point per base when True, otherwise only the end of each TP or FP run
+    '''
+    keys, tps, fps = segments
+    steps = np.empty(2 * len(keys), dtype=np.int64)
+    steps[0::2] = fps
+    steps[1::2] = tps
+    isfp = np.zeros(2 * len(keys), dtype=bool)
+    isfp[0::2] = True
+    keep = steps > 0
+    steps = steps[keep]
+    isfp = isfp[keep]
+
+    if precise: # one unit step per base, without iterating the bases in python
+        isfp = np.repeat(isfp, steps)
+        xsum = np.cumsum(isfp)
+        ysum = np.arange(1, len(isfp) + 1) - xsum
+    else:
+        xsum = np.cumsum(np.where(isfp, steps, 0))
+        ysum = np.cumsum(np.where(isfp, 0, steps))
+    return xsum / XDENOM, ysum / YDENOM
+
+def compress_points(xs,ys):
+    '''
+    Lossless compression of ROC points (e.g. from get_points_to_plot()), returns xs, ys <numpy.array>
+    Only the first and last point and the vertices where the curve changes direction are kept, the dropped points
+    lie on the straight lines between them (e.g. a per base run of TPs is reduced to its two ends)
+    '''
+    return ribbon.compress(xs,ys)
+
+def compress_stream(points):
+    '''
+    Streaming version of compress_points(), for a generator of points (x,y) - yields the kept points
+    '''
+    kept = [] # last two kept points
+    for point in points:
+        if kept and point == kept[-1]:
+            continue # repeated point
+        if len(kept) > 1 and (kept[-1][0] - kept[-2][0]) * (point[1] - kept[-1][1]) == (kept[-1][1] - kept[-2][1]) * (point[0] - kept[-1][0]):
+            kept[-1] = point # same direction, move the end of the run
+            continue
+        if len(kept) > 1:
+            yield kept[-2]
+            kept = kept[-1:]
+        kept.append(point)
+    for point in kept:
+        yield point
+
+def stream_bed(filename,formats=('Peaks','idr')):
+    '''
+    Generator over (chrom, bed.BedColumns) of a bed file grouped by chromosome, one chromosome at a time (see bed.iterBedChroms)
+    The file is read with the first of formats [str,str..] that parses its first chromosome
+    '''
+    for format in formats:
+        chroms = bed.iterBedChroms(filename, format)
+        try:
+            first = next(chroms, None)
+        except RuntimeError:
+            raise
+        except:
+            if format == formats[-1]:
+                raise
+            continue
+        if first is not None:
+            yield first
+        for chrom in chroms:
+            yield chrom
+        return
+
+def stream_total_bases(filename,formats=('Peaks','idr')):
+    '''
+    total_bases() of a bed file grouped by chromosome, without loading it
+    '''
+    return sum(int(np.sum(columns.ends - columns.starts)) for chrom, columns in stream_bed(filename, formats))
+
+def covered_columns(*columns):
+    '''
+    covered_bases() for the bed.BedColumns of one chromosome (None for a file without entries there)
+    '''
+    pairs = [(c.starts, c.ends) for c in columns if c is not None]
+    if not pairs:
+        return 0
+    starts, ends = bed.unionIntervals(*pairs)
+    return int(np.sum(ends - starts))
+
+chrom_orders = {} # bed.scanBedChroms() of each file, by (filename, modification time, size)
+
+def chrom_order(*filenames):
+    '''
+    Returns the chromosomes [str,..] of bed files (filenames) in one order that agrees with the order of each file,
+    e.g. lexicographic (sort -k1,1, in any locale) or natural (chr1, chr2, .., chr10) - chromosomes that no file
+    orders are taken in the order they are first seen
+    Every file is scanned once (see bed.scanBedChroms()), so a RuntimeError is raised before anything is calculated
+    if the files order their chromosomes differently or a file is not grouped by chromosome
+    '''
+    lists = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+        if key not in chrom_orders:
+            chrom_orders[key] = bed.scanBedChroms(filename)
+        lists.append(chrom_orders[key])
+    seen = {} # first seen position of each chromosome
+    after = {} # chromosomes that some file has right after each chromosome
+    before = {} # number of chromosomes that some file has right before each chromosome
+    for names in lists:
+        for i, chrom in enumerate(names):
+            seen.setdefault(chrom, len(seen))
+            after.setdefault(chrom, set())
+            before.setdefault(chrom, 0)
+            if i > 0 and chrom not in after[names[i-1]]:
+                after[names[i-1]].add(chrom)
+                before[chrom] += 1
+    ready = [(seen[chrom], chrom) for chrom in seen if before[chrom] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        position, chrom = heapq.heappop(ready)
+        order.append(chrom)
+        for following in after[chrom]:
+            before[following] -= 1
+            if before[following] == 0:
+                heapq.heappush(ready, (seen[following], following))
+    if len(order) < len(seen):
+        left = sorted((chrom for chrom in seen if before[chrom] > 0), key=seen.get)
+        raise RuntimeError('bed files order their chromosomes differently ('+', '.join(left)+') - '+', '.join(filenames))
+    return order
+
+def paired_chroms(*streams,order=None):
+    '''
+    Walks generators of (chrom, bed.BedColumns) (from stream_bed()) in step
+    yields (chrom, [columns or None,..]) for every chromosome, with the columns of each stream on that chromosome
+    order [str,..] --> the chromosomes in the order of the streams (see chrom_order()), by default the streams need to
+                       be sorted by chromosome name (e.g. LC_ALL=C sort -k1,1 -k2,2n)
+    A RuntimeError is raised if a stream does not follow the order
+    '''
+    rank = dict((chrom, i) for i, chrom in enumerate(order)) if order is not None else None
+    def position(chrom):
+        if rank is None:
+            return chrom
+        if chrom not in rank:
+            raise RuntimeError('chromosome '+str(chrom)+' is not in the order of the bed files')
+        return rank[chrom]
+    heads = [next(stream, None) for stream in streams]
+    last = None
+    while any(head is not None for head in heads):
+        chrom = min((head[0] for head in heads if head is not None), key=position)
+        if last is not None and position(chrom) <= position(last):
+            raise RuntimeError('bed files are not sorted by chromosome ('+str(chrom)+' after '+str(last)+')')
+        out = []
+        for i in range(len(streams)):
+            if heads[i] is not None and heads[i][0] == chrom:
+                out.append(heads[i][1])
+                heads[i] = next(streams[i], None)
+            else:
+                out.append(None)
+        last = chrom
+        yield chrom, out
+
+def read_run(filename,blocksize=1<<16):
+    '''
+    Generator over the (key,tp_bases,fp_bases) rows of a run spilled by stream_points_to_plot(), read block by block
+    '''
+    run = np.load(filename, mmap_mode='r')
+    for i in range(0, run.shape[1], blocksize):
+        block = np.array(run[:, i:i+blocksize])
+        for row in zip(block[0].tolist(), block[1].tolist(), block[2].tolist()):
+            yield row
+
+def stream_points_to_plot(TP,TN,FP,FN,test,name2,metric='pValue',ascending=None,tmpdir=None):
+    '''
+    Streaming version of get_points_to_plot(bybase=True,precise=False) for test sets larger than memory
+    TP,TN,FP,FN,test (filename,formats) --> bed files grouped by chromosome, in an order they share (see chrom_order())
+    name2 (str) --> name of the experimental group
+    metric (str), ascending (bool) --> see get_points_to_plot()
+    tmpdir (str) --> directory for the temporary files (default: the system's)
+    The files are swept one chromosome at a time, the per score TP/FP base counts of each chromosome are spilled
+    to a temporary file, and the spilled runs are merged by score to produce the cumulative counts
+    yields the ROC points (x,y) as compress_points(*get_points_to_plot(..)) would return them
+    '''
+    if ascending is None:
+        ascending = 'idr' not in name2.lower()
+    with tempfile.TemporaryDirectory(dir=tmpdir) as spilldir:
+        runs = []
+        YDENOM = 0
+        XDENOM = 0
+        order = chrom_order(*[files[0] for files in (test, TP, FP, FN, TN)])
+        for chrom, (tests, TPs, FPs, FNs, TNs) in paired_chroms(*[stream_bed(*files) for files in (test, TP, FP, FN, TN)],order=order):
+            ranked, tpivs, fpivs = [], [], []
+            YDENOM += covered_columns(TPs,FNs)
+            XDENOM += covered_columns(FPs,TNs)
+            if TPs is not None:
+                tpivs = list(zip(TPs.starts.tolist(), TPs.ends.tolist()))
+            if FPs is not None:
+                fpivs = list(zip(FPs.starts.tolist(), FPs.ends.tolist()))
+            if tests is not None:
+                keys = tests.score(metric) * (1 if ascending else -1)
+                ranked = list(zip(tests.starts.tolist(), tests.ends.tolist(), keys.tolist()))
+            segments = aggregate_segments(sweep_chrom(ranked, tpivs, fpivs))
+            if len(segments[0]) > 0:
+                runs.append(os.path.join(spilldir, str(len(runs))+'.npy'))
+                np.save(runs[-1], np.array(segments, dtype=float))
+
+        def steps():
+            xsum = 0
+            ysum = 0
+            key = None
+            tps = fps = 0
+            for nextkey, tp, fp in heapq.merge(*[read_run(run) for run in runs]):
+                if nextkey != key and key is not None: # all counts of key are in
+                    if fps:
+                        xsum += fps
+                        yield xsum / XDENOM, ysum / YDENOM
+                    if tps:
+                        ysum += tps
+                        yield xsum / XDENOM, ysum / YDENOM
+                    tps = fps = 0
+                key = nextkey
+                tps += tp
+                fps += fp
+            if fps:
+                xsum += fps
+                yield xsum / XDENOM, ysum / YDENOM
+            if tps:
+                ysum += tps
+                yield xsum / XDENOM, ysum / YDENOM
+
+        for point in compress_stream(steps()):
+            yield point
+
+def get_points_to_plot(TP,TN,FP,FN,test,all,name2,bybase=True,precise=True,metric='pValue',ascending=None,jobs=1):
+    '''
+    calculates points for ROC curve plotting and returns them as xs, ys [float,float,...]
+    TP (bfile) --> True Positives
+    TN (bfile) --> True Negatives
+    FP (bfile) --> False Positives
+    FN (bfile) --> False Negatives
+    all (bfile) --> All test data
+    name2 (str) --> name of the experimental group
+    bybase (bool) --> calc by base or by peak
+    precise (bool) --> Reports every single base when True, otherwise collapses:
+                - e.g if the region 80-86 is all Tp, precise True returns x.y values corresponding to 
+                - 80,81,82,83,84,85,86 whereas i precise is False only the vx,y values of 80 and 86 are returned (the inbetween can be inferred) 
+    metric (str) --> field of the test entries to rank them by (see bed.BedFile.scores())
+    ascending (bool) --> rank the lowest metric first when True, the highest first when False, by default
+                         the highest first only for IDR output ('idr' in name2)
+    jobs (int) --> by base, number of worker processes sweeping chromosomes at the same time (see sweep_segments())
+    By peak, the entries of all overlapping a TP or FN region are the positives, and each test entry that overlaps
+    a TP region is a TP (see peak_labels())
+    '''
+    if ascending is None:
+        ascending = 'idr' not in name2.lower()
+    if bybase:
+        with instrument.stage('denominators'):
+            YDENOM = covered_bases(TP,FN) # positive bases, each counted once like the sweep does
+            XDENOM = covered_bases(FP,TN)
+        with instrument.stage('sweep', items=len(test), jobs=jobs):
+            segments = sweep_segments(TP,FP,test,metric,ascending,jobs)
+        with instrument.stage('points', precise=precise) as making:
+            points = points_from_segments(segments,XDENOM,YDENOM,precise=precise)
+            making.items = len(points[0])
+        return points
+
+    # label every peak once
+    with instrument.stage('peak labels', items=len(test)+len(all)):
+        hits = peak_labels(test,TP) # test peaks overlapping a TP region
+        if all is test:
+            positives = peak_labels(all,FN)
+            for chrom in positives:
+                positives[chrom] |= hits[chrom]
+        else:
+            positives = peak_labels(all,TP,FN)
+        YDENOM = sum(int(np.count_nonzero(labels)) for labels in positives.values())
+        XDENOM = sum(len(labels) for labels in positives.values()) - YDENOM
+
+    # for graphing
+    with instrument.stage('points', items=len(test)):
+        chroms, idx = test.ranking(metric, ascending) # each entry - sorted once
+        istp = np.zeros(len(idx), dtype=bool)
+        bychrom = np.argsort(chroms, kind='stable') # entries grouped by chromosome once
+        names, firsts = np.unique(chroms[bychrom], return_index=True)
+        bounds = np.append(firsts, len(bychrom))
+        for c, chrom in enumerate(names.tolist()):
+            inchrom = bychrom[bounds[c]:bounds[c+1]]
+            istp[inchrom] = hits[chrom][idx[inchrom]]
+        ysum = np.cumsum(istp)
+        xsum = np.arange(1, len(istp) + 1) - ysum
+    return xsum / XDENOM, ysum / YDENOM
+
+def peak_labels(query,*bfiles):
+    '''
+    Labels the entries of query (bed.BedFile) in one batched join per bedfile (bed.BedFile.overlapMany())
+    returns dict {chrom: <numpy.array>} of bools, in the order of query.columns(chrom) - True for the entries that
+    overlap an entry of any of bfiles (bed.BedFile)
+    '''
+    labels = {}
+    for chrom in query.chroms:
+        labels[chrom] = np.zeros(len(query.columns(chrom)), dtype=bool)
+    for bfile in bfiles:
+        for chrom, (qidx, hidx, isectStart, isectEnd) in bfile.overlapMany(query).items():
+            labels[chrom][qidx] = True
+    return labels
+
+def save_csv(name,points):
+    '''
+    Saves ROC points (from get_points_to_plot()) as csv for parsing later
+    FIXME: Maybe make not to the general directory
+    '''
+    save_rows(name,zip(points[0],points[1]))
+
+def save_rows(name,rows):
+    '''
+    Saves ROC points given one (x,y) row at a time (e.g. from stream_points_to_plot()) as csv, see save_csv()
+    '''
+    with open(name+'.csv', 'w',newline='') as csvfile:
+        spamwriter = csv.writer(csvfile, delimiter=',',dialect='excel')
+        for row in rows:
+            spamwriter.writerow(row)
+
+def save_npy(name,points):
+    '''
+    Binary version of save_csv(name,points): saves ROC points as one float64 array of shape (2, no. points), xs then ys,
+    to name.npy in a single write - read back (memory-mapped) by ribbon.parse_npy()
+    '''
+    np.save(name+'.npy', np.array([np.asarray(points[0], dtype=float), np.asarray(points[1], dtype=float)]).reshape(2, -1))
+
+def save_points(name,points,output='csv'):
+    '''
+    Saves ROC points (xs, ys) as name.csv (save_csv()) or name.npy (save_npy()) for output 'csv' or 'npy'
+    A leftover file of the other format is removed, as ribbon.parse_all() prefers .npy files
+    '''
+    if output == 'npy':
+        save_npy(name,points)
+    else:
+        save_csv(name,points)
+    other = name+('.csv' if output == 'npy' else '.npy')
+    if os.path.exists(other):
+        os.remove(other)
+
+def assert_data(True_Pos,True_Neg,All,False_pos,False_Neg):
+    '''
+    True if bedtools operations have been performed successfully
+    True_Pos,True_Neg,All,False_pos,False_Neg - <bed.Bedfile>
+    '''
+    # checks files are correct (no base is labelled twice)
+    with instrument.stage('assert_data', items=5):
+        counts = [total_bases(bfile) for bfile in (True_Pos,True_Neg,False_pos,False_Neg,All)]
+    if sum(counts[:4])-counts[4] == 0:
+        return True
+    else:
+        # debug
+        print(*counts)
+        print(sum(counts[:4])-counts[4])
+        return False
+
+def chrom_fingerprint(chrom,starts,ends):
+    '''
+    The part of fingerprint() for the merged intervals (starts, ends) of one chromosome: the number of bases covered
+    and (chrom, hash), or None without intervals
+    '''
+    if len(starts) == 0:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.asarray(starts, dtype='<i8').tobytes())
+    digest.update(np.asarray(ends, dtype='<i8').tobytes())
+    return int(np.sum(np.asarray(ends) - np.asarray(starts))), (chrom, digest.hexdigest())
+
+def join_fingerprints(parts):
+    '''
+    fingerprint() from the chrom_fingerprint() of each chromosome, in any order
+    '''
+    bases = 0
+    hashes = []
+    for part in parts:
+        if part is not None:
+            bases += part[0]
+            hashes.append(part[1])
+    return bases, tuple(sorted(hashes))
+
+def fingerprint(merges):
+    '''
+    Returns a fingerprint (tuple) of a set of bed files, equal for sets covering the same bases: the number of bases
+    covered and a hash (blake2b) of the merged intervals of each chromosome, so the order of the entries does not matter
+    merges {chrom: (starts, ends)} --> their disjoint merged intervals (e.g. bed.BedFile.union())
+    Overlapping entries count once, so partition files that were merged (e.g. by label_partitions()) and ones that
+    keep a piece per overlapping test entry (e.g. from bedtools intersect) both match their test set
+    '''
+    return join_fingerprints(chrom_fingerprint(chrom, *merges[chrom]) for chrom in merges)
+
+def bed_fingerprint(*bfiles):
+    '''
+    fingerprint() of the bedfiles (bed.BedFile) together, e.g. of a test set or of the TP, TN, FP and FN partition of one
+    '''
+    return fingerprint(bfiles[0].union(*bfiles[1:]))
+
+def stream_fingerprint(*files):
+    '''
+    bed_fingerprint() of bed files [(filename,formats),..] grouped by chromosome (see chrom_order()), without loading them
+    Only the merged intervals of one chromosome are held at a time
+    '''
+    order = chrom_order(*[filename for filename, formats in files])
+    def parts():
+        for chrom, columns in paired_chroms(*[stream_bed(filename, formats) for filename, formats in files],order=order):
+            pairs = [(c.starts, c.ends) for c in columns if c is not None]
+            yield chrom_fingerprint(chrom, *bed.unionIntervals(*pairs))
+    return join_fingerprints(parts())
+
+def fingerprint_index(files,stream=False):
+    '''
+    Returns {fingerprint: [(filename,formats),..]} of the test sets files [(filename,formats),..] (see fingerprint())
+    stream (bool) --> read the files with stream_fingerprint() instead of loading them
+    '''
+    index = {}
+    with instrument.stage('fingerprint test sets', items=len(files)):
+        for file in files:
+            key = stream_fingerprint(file) if stream else bed_fingerprint(load_bed(*file))
+            index.setdefault(key, []).append(file)
+    return index
+
+def largest_test_set(prefixes,root='.'):
+    '''
+    Returns <bed.BedFile> the largest test data set, must be all encompasaing i.e every point is labelled
+    '''
+    filename, formats = largest_test_file(prefixes,root)
+    return load_bed(filename,formats)
+
+def largest_test_file(prefixes,root='.'):
+    '''
+    Returns (filename,formats) of the largest test data set, see largest_test_set()
+    '''
+    winner = 0
+    winnerfile = None
+    for expgroup in prefixes: 
+        filename = os.path.join(root,'Test_data',str(expgroup)+".bed")
+        winningcount = total_bases(load_bed(filename))
+        if winningcount > winner:
+            winnerfile = (filename,('Peaks','idr'))
+            winner = winningcount
+
+    return winnerfile
+
+def label_partitions(test,truth,universe):
+    '''
+    Labels the bases of universe the way the bedtools steps would, returns the TP, TN, FP, FN <bed.BedFile>
+    test (bfile) --> the test data, its bases are the positives
+    truth (bfile) --> the true regions
+    universe (bfile) --> every labelled region (e.g. largest_test_set()), bases outside it are not labelled
+    Each base of universe ends up in exactly one of the four, so the partition needs no assert_data() check
+    '''
+    with instrument.stage('label_partitions', items=len(test)+len(truth)+len(universe)):
+        tested = bed.BedFile.fromIntervals(universe.intersect(test))
+        untested = bed.BedFile.fromIntervals(universe.subtract(test))
+        TP = bed.BedFile.fromIntervals(tested.intersect(truth))
+        FP = bed.BedFile.fromIntervals(tested.subtract(truth))
+        FN = bed.BedFile.fromIntervals(untested.intersect(truth))
+        TN = bed.BedFile.fromIntervals(untested.subtract(truth))
+    return TP, TN, FP, FN
+
+def name_groups(prefixes):
+    '''
+    Request user input on the exact name of each experimental group, for graphing
+    returns [str,str,str..] - the names 
+    '''
+    names =[]
+    for pref in prefixes:
+        names.append(input('Please specify this groups full name '+str(pref)+" : "))
+    return names
+
+def compute_task(task,chromjobs=1):
+    '''
+    Calculates and saves the ROC points of one (group, replicate, level) task - run by main() in worker processes
+    task (tuple) --> (name, mode, files, expgroup, bybase, stream, output) where:
+        name (str) --> output name, see save_points()
+        mode (str) --> where the TP, TN, FP and FN partitions come from: 'partition' for files prepared in folders,
+                       'label' to label them in memory with label_partitions()
+        files [(filename,formats),..] --> see load_bed(), with mode 'partition' the TP, TN, FP, FN, test and all
+                                          (matching test set) files, with mode 'label' the test, truth and universe files
+        expgroup (str) --> name of the experimental group
+        bybase (bool) --> calc by base or by peak
+        stream (bool) --> with mode 'partition', calc by base with stream_points_to_plot(), without loading the files
+        output (str) --> 'csv' or 'npy', see save_points()
+    chromjobs (int) --> number of worker processes sweeping the chromosomes of a base level task (see sweep_segments())
+    Returns name once the output is written
+    '''
+    name, mode, files, expgroup, bybase, stream, output = task
+    if mode not in ('partition', 'label'):
+        raise RuntimeError('unknown task mode '+str(mode)+' for '+name)
+    stamp = task_stamp(task) # the inputs as they are read
+    if os.path.exists(name+'.dep'):
+        os.remove(name+'.dep') # the output is rewritten in place, so out of date until save_stamp() (e.g. if interrupted)
+    level = 'Base' if bybase else 'Peak'
+    print('calculating points - '+level+' level', name)
+    with instrument.stage('task', replicate=name, group=expgroup, level=level):
+        if bybase and stream and mode == 'partition':
+            with instrument.stage('stream + write', output=output):
+                rows = stream_points_to_plot(*files[:5],expgroup)
+                if output == 'npy':
+                    save_points(name,np.array(list(rows), dtype=float).reshape(-1, 2).T,output) # only the vertices, so small
+                else:
+                    save_rows(name,rows) # write output to csv as it is calculated
+                    if os.path.exists(name+'.npy'):
+                        os.remove(name+'.npy') # stale, see save_points()
+            save_stamp(task,stamp)
+            return name
+        if mode == 'label':
+            test, truth, possibility = [load_bed(filename, formats) for filename, formats in files]
+            TP, TN, FP, FN = label_partitions(test, truth, possibility)
+            release_beds(files[1:2]) # the truth of this replicate
+        else:
+            TP, TN, FP, FN, test, possibility = [load_bed(filename, formats) for filename, formats in files]
+            release_beds(files[:4]) # the partition of this replicate, freed with TP, TN, FP and FN
+        points = get_points_to_plot(TP,TN,FP,FN,test,possibility,expgroup,bybase=bybase,precise=False,jobs=chromjobs) # runs of bases collapsed
+        with instrument.stage('write', output=output) as writing:
+            points = compress_points(*points)
+            writing.items = len(points[0])
+            save_points(name,points,output) # write output to csv or npy
+        save_stamp(task,stamp)
+    return name
+
+def traced_task(task,chromjobs=1):
+    '''
+    compute_task() in a worker process, returns name and the records of the worker (see instrument.take_events())
+    '''
+    name = compute_task(task,chromjobs)
+    return name, instrument.take_events()
+
+def run_tasks(tasks,jobs=1,chromjobs=1):
+    '''
+    Runs compute_task() for each task [tuple,..], spread over jobs (int) worker processes
+    Tasks only hold file names, each worker loads the files it needs itself (keeping the test sets, see release_beds())
+    chromjobs (int) --> see compute_task()
+    Returns the output names, in the order of tasks
+    '''
+    if jobs <= 1 or len(tasks) <= 1:
+        return [compute_task(task,chromjobs) for task in tasks]
+    names = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,initializer=instrument.take_events) as executor: # forked workers drop the records they inherit
+        for name, events in executor.map(functools.partial(traced_task,chromjobs=chromjobs), tasks):
+            instrument.add_events(events) # worker records, if instrumentation is on
+            names.append(name)
+    return names
+
+def task_stamp(task):
+    '''
+    What the output of a task (see compute_task()) depends on, as a dict: the size and modification time of each input
+    file and the parameters of the calculation - recorded next to the output by save_stamp()
+    '''
+    name, mode, files, expgroup, bybase, stream, output = task
+    inputs = []
+    for filename, formats in files:
+        stat = os.stat(filename)
+        inputs.append([os.path.abspath(filename), list(formats), stat.st_mtime_ns, stat.st_size])
+    return {'mode': mode, 'inputs': inputs, 'expgroup': str(expgroup), 'bybase': bybase, 'precise': False, 'metric': 'pValue', 'output': output}
+
+def save_stamp(task,stamp=None):
+    '''
+    Writes stamp (dict), by default task_stamp(task), to name.dep once the output of the task is written
+    The stamp should be taken before the calculation (see compute_task()), so that an input changed while the task
+    runs leaves the output out of date
+    '''
+    with open(task[0]+'.dep', 'w') as depfile:
+        json.dump(stamp if stamp is not None else task_stamp(task), depfile)
+
+def remove_stale_outputs(outdir,expgroup,replicates):
+    '''
+    Removes the outputs (.csv, .npy and .dep files) of the replicates of expgroup (str) in outdir (str) numbered
+    replicates (int) or above, e.g. after a replicate was removed, so that ribbon.parse_all() does not graph them
+    '''
+    pattern = re.compile(re.escape(str(expgroup))+r'_(\d+)(Peaks|Bases)\.(csv|npy|dep)$')
+    for filename in sorted(os.listdir(outdir)):
+        match = pattern.match(filename)
+        if match and int(match.group(1)) >= replicates:
+            print('removing stale output', os.path.join(outdir,filename))
+            os.remove(os.path.join(outdir,filename))
+
+def up_to_date(task):
+    '''
+    True if the output of task (see compute_task()) exists and was calculated from the same inputs and parameters
+    '''
+    name, output = task[0], task[-1]
+    if not os.path.exists(name+'.'+output):
+        return False
+    try:
+        with open(name+'.dep') as depfile:
+            return json.load(depfile) == task_stamp(task)
+    except (OSError, ValueError):
+        return False # no (readable) record, or an input is gone
+
+def level_tasks(name,mode,files,expgroup,stream=False,output='csv'):
+    '''
+    The peak and base level tasks (see compute_task()) of one replicate, writing to name+'Peaks' and name+'Bases'
+    '''
+    return [(name+'Peaks', mode, files, expgroup, False, stream, output), # Peak level
+            (name+'Bases', mode, files, expgroup, True, stream, output)] # Base level
+
+def partition_tasks(prefixes,root='.',outdir='.',stream=False,output='csv',force=False):
+    '''
+    The tasks (see compute_task()) of every replicate of the experimental groups prefixes [str,str..] whose TP, TN, FP
+    and FN files were prepared in the folders under root, matching each replicate to its test set by fingerprint(): the
+    partition of a replicate covers the same bases as its test set, a RuntimeError is raised if several test sets match
+    Replicates whose outputs are up to date (see up_to_date()) are left out, unless force (bool), and the outputs of
+    replicates that are gone are removed (see remove_stale_outputs())
+    '''
+    runs = sorted(run for run in os.listdir(os.path.join(root,'True_Positives')) if not run.endswith('.npz'))
+    Directorynames= [os.path.join(root,subdir) for subdir in ('True_Positives','False_Positives','True_Negatives','False_Negatives')]
+    allfiles = [(os.path.join(root,'Test_data',str(prefix)+'.bed'),('Peaks','idr')) for prefix in prefixes] # used to infer the appropriate grouping for each run 
+    index = None # fingerprint_index() of allfiles, made once it is needed
+
+    tasks = []
+    for expgroup in prefixes:
+        TPs,FPs,TNs,FNs = [],[],[],[] # (filename,formats) of each replicate
+        print('finding bed files - '+str(expgroup))
+        for subdir in Directorynames:
+            for bfile in runs: 
+                if str(expgroup) == str(bfile)[0:len(str(expgroup))] and str(bfile)[len(str(expgroup))] == '_':
+                    filename = os.path.join(subdir,str(bfile))
+                    print(filename)
+                    if 'idr' not in str(expgroup).lower():
+                        formats = ('Peaks',)
+                    elif subdir in Directorynames[2:]:
+                        formats = ('idr','simple') # check for basic data - resulting from bedtools
+                    else:
+                        formats = ('idr',)
+                    if subdir == Directorynames[0]:
+                        TPs.append((filename,formats))
+                    elif subdir == Directorynames[1]:
+                        FPs.append((filename,formats))
+                    elif subdir == Directorynames[2]:
+                        TNs.append((filename,formats))
+                    else:
+                        FNs.append((filename,formats))
+
+        testfile = (os.path.join(root,'Test_data',str(expgroup)+".bed"),('Peaks','idr'))
+        remove_stale_outputs(outdir,expgroup,len(TPs)) # of replicates that were removed
+        
+        # Calculation steps
+        for i in range(len(TPs)):
+            partition = [TPs[i],TNs[i],FPs[i],FNs[i]]
+            name = os.path.join(outdir,str(expgroup)+"_"+str(i))
+            if not force and any(all(up_to_date(task) for task in level_tasks(name,'partition',partition+[testfile,allfile],expgroup,stream,output)) for allfile in allfiles):
+                print('up to date', name)
+                continue
+            print('loading bed files', name)
+            if index is None:
+                index = fingerprint_index(allfiles,stream)
+            with instrument.stage('match test set', replicate=name):
+                if stream:
+                    key = stream_fingerprint(*partition)
+                else:
+                    key = bed_fingerprint(*[load_bed(filename,formats) for filename, formats in partition])
+                    release_beds(partition)
+            matches = index.get(key, [])
+            if len(matches) > 1:
+                raise RuntimeError('the partition of '+name+' matches several test sets: '+', '.join(filename for filename, formats in matches))
+            if not matches:
+                print('no test set covers the same bases as', name)
+                continue
+            if stream: # before any output is written, see stream_points_to_plot()
+                chrom_order(*[filename for filename, formats in partition+[testfile]])
+            tasks.extend(task for task in level_tasks(name,'partition',partition+[testfile,matches[0]],expgroup,stream,output) if force or not up_to_date(task))
+    return tasks
+
+def label_tasks(prefixes,truths,universe=None,root='.',outdir='.',output='csv',force=False):
+    '''
+    The tasks (see compute_task()) of the experimental groups prefixes [str,str..] when the partitions are labelled in
+    memory by label_partitions() instead of being read from the folders under root
+    truths [str,str..] --> bed files of the true regions, one per replicate
+    universe (str) --> bed file of every labelled region, largest_test_file() if not given
+    Tasks whose outputs are up to date (see up_to_date()) are left out, unless force (bool), and the outputs of
+    replicates beyond the number of truths are removed (see remove_stale_outputs())
+    '''
+    universefile = (universe,('Limited',)) if universe else largest_test_file(prefixes,root)
+    tasks = []
+    for expgroup in prefixes:
+        testfile = (os.path.join(root,'Test_data',str(expgroup)+".bed"),('Peaks','idr'))
+        remove_stale_outputs(outdir,expgroup,len(truths)) # of replicates that were removed
+        for i in range(len(truths)):
+            name = os.path.join(outdir,str(expgroup)+"_"+str(i))
+            files = [testfile,(truths[i],('Limited',)),universefile]
+            tasks.extend(task for task in level_tasks(name,'label',files,expgroup,False,output) if force or not up_to_date(task))
+    return tasks
+
+def main(root='.',groups=None,names=None,titles=None,outdir='.',fmt=None,jobs=1,stream=False,output='csv',summary=False,max_fpr=0.1,fprs=(0.05,0.1),force=False,truths=None,universe=None,chromjobs=1,trace=None):
+    '''
+    Generates ROC curves from bedfiles (.bed)
+    Assuming correct folder management, should return comparitive ribbon plots of all the .bed files of each experimental group in the required subdirectories
+    Only outputs whose inputs or parameters changed since they were written (see up_to_date()) are calculated again
+    root (str) --> directory holding the True_Positives, False_Positives, True_Negatives, False_Negatives and Test_data folders
+    groups [str,str..] --> prefixes of the experimental groups, all groups in Test_data if not given
+    names [str,str..] --> full names of the groups for graphing, asked for if not given
+    titles (str,str) --> titles of the peak and base level graphs, asked for if not given
+    outdir (str) --> directory for the .csv (or .npy) outputs and the graphs
+    fmt (str) --> e.g. 'png', 'svg' or 'pdf' to save the graphs without a display (see ribbon.ribbon), shown otherwise
+    jobs (int) --> number of worker processes for the calculation of the ROC points
+    stream (bool) --> read the bed files (grouped by chromosome, see chrom_order()) one chromosome at a time for
+                      matching and for the base level, instead of loading them (see stream_points_to_plot()) - the
+                      peak level still loads them
+    output (str) --> 'csv' or 'npy', the format of the ROC point outputs (see save_points())
+    summary (bool) --> also write outdir/metrics.csv, with the AUC, partial AUC up to max_fpr (float) and TPR at each
+                       of fprs (float,..) of each group and level (see metrics.save_metrics())
+    force (bool) --> calculate every output again
+    truths [str,str..] --> bed files of the true regions, one per replicate: the TP, TN, FP and FN partitions are then
+                           labelled in memory (see label_partitions()) instead of being read from the folders under root,
+                           so not with stream
+    universe (str) --> with truths, bed file of every labelled region (default: the largest test set)
+    chromjobs (int) --> number of worker processes sweeping the chromosomes of each base level calculation, on top of jobs
+    trace (str) --> file to write the time, CPU time, items and peak memory of each stage to, as a Chrome trace
+                    (see instrument.py), also set by the ROC_TRACE environment variable
+    ''' 
+    # file management stuff
+    prefixes = groups if groups else get_prefixes(root)
+    if not names:
+        names = name_groups(prefixes) # full names for graphing 
+    os.makedirs(outdir, exist_ok=True)
+    if truths and stream:
+        raise RuntimeError('stream can not be used with truths, the partitions are labelled in memory')
+    if trace:
+        instrument.enable(trace) # before any worker process starts
+    # loading file steps
+    with instrument.stage('find tasks') as finding:
+        if truths:
+            tasks = label_tasks(prefixes,truths,universe,root,outdir,output,force)
+        else:
+            tasks = partition_tasks(prefixes,root,outdir,stream,output,force)
+        finding.items = len(tasks)
+
+    with instrument.stage('run tasks', items=len(tasks), jobs=jobs, chromjobs=chromjobs):
+        run_tasks(tasks,jobs,chromjobs)
+    with instrument.stage('graph', items=len(prefixes)):
+        ribbon.ribbon(prefixes,names,titles,outdir,fmt) # Graph curves
+
+    if summary:
+        with instrument.stage('metrics', items=len(prefixes)):
+            metrics.save_metrics(prefixes,names,outdir,max_fpr,fprs)
+    instrument.save() # only with trace or ROC_TRACE
+
+def parse_args(argv=None):
+    '''
+    Command line options of main(), argv [str,str..] defaults to sys.argv
+    '''
+    parser = argparse.ArgumentParser(description='Generates ROC curves from bedfiles (.bed)')
+    parser.add_argument('--root', default='.', help='directory holding the True_Positives, False_Positives, True_Negatives, False_Negatives and Test_data folders (default .)')
+    parser.add_argument('--groups', nargs='+', help='prefixes of the experimental groups (default all groups in Test_data)')
+    parser.add_argument('--names', nargs='+', help='full names of the groups for graphing, one per group (asked for if not given)')
+    parser.add_argument('--titles', nargs=2, metavar=('PEAKS','BASES'), help='titles of the peak and base level graphs (asked for if not given)')
+    parser.add_argument('--outdir', default='.', help='directory for the .csv (or .npy) outputs and the graphs (default .)')
+    parser.add_argument('--output', choices=['csv','npy'], default='csv', help='format of the ROC point outputs, npy is binary (default csv)')
+    parser.add_argument('--format', choices=['png','svg','pdf'], help='save the graphs in this format without a display, instead of showing them')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes for the ROC calculations (default 1)')
+    parser.add_argument('--chrom-jobs', type=int, default=1, metavar='N', help='number of worker processes sweeping the chromosomes of each base level calculation, so that one large replicate can use several cores (default 1)')
+    parser.add_argument('--stream', action='store_true', help='read the bed files one chromosome at a time instead of loading them, for base level curves of inputs larger than memory (the rows of each chromosome must be together, in a chromosome order the files share); peak level curves still load the files')
+    parser.add_argument('--metrics', action='store_true', help='also write metrics.csv to the output directory: AUC, partial AUC and TPR at fixed FPRs with bootstrap intervals over replicates')
+    parser.add_argument('--max-fpr', type=float, default=0.1, help='FPR up to which the partial AUC is taken (default 0.1)')
+    parser.add_argument('--tpr-at', type=float, nargs='+', default=[0.05,0.1], metavar='FPR', help='FPRs at which the TPR is reported (default 0.05 0.1)')
+    parser.add_argument('--truth', nargs='+', metavar='FILE', help='bed files of the true regions, one per replicate: the TP, TN, FP and FN partitions are labelled in memory instead of being read from their folders')
+    parser.add_argument('--universe', metavar='FILE', help='with --truth, bed file of every labelled region (default: the largest test set)')
+    parser.add_argument('--force', action='store_true', help='calculate every output again, even if its inputs did not change')
+    parser.add_argument('--trace', metavar='FILE', help='write the time, CPU time, items and peak memory of each pipeline stage to FILE as a Chrome trace (also set by ROC_TRACE)')
+    args = parser.parse_args(argv)
+    if args.names and len(args.names) != len(args.groups if args.groups else get_prefixes(args.root)):
+        parser.error('--names needs one name per group')
+    if args.truth and args.stream:
+        parser.error('--stream can not be used with --truth, the partitions are labelled in memory')
+    return args
+
+if __name__ == "__main__": 
+    args = parse_args()
+    main(root=args.root,groups=args.groups,names=args.names,titles=args.titles,outdir=args.outdir,fmt=args.format,jobs=args.jobs,stream=args.stream,output=args.output,summary=args.metrics,max_fpr=args.max_fpr,fprs=args.tpr_at,force=args.force,truths=args.truth,universe=args.universe,chromjobs=args.chrom_jobs,trace=args.trace)
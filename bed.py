@@ -3,11 +3,21 @@ Author -> Mikael Boden
  - Some small additions to BedFile class - Richard
 '''
 import ival
+import os, sys, mmap, itertools, tempfile, zipfile
+import numpy as np
 
 class BedEntry():
+    """ One BED row. Attributes are kept in slots rather than an instance dictionary, to keep entries small:
+        the optional fields (set by addOption) only hold a value once set, and reading one that is not set raises
+        AttributeError as for any missing attribute (e.g. getattr(entry, 'pValue', None) returns None).
+    """
+
+    __slots__ = ('chrom', 'chromStart', 'chromEnd', 'usestrand', 'strand', 'name', 'blocks',
+                 'score', 'thickStart', 'thickEnd', 'itemRgb', 'signalValue', 'pValue', 'qValue', 'peak',
+                 'tags', 'summit', 'fold', 'fdr', 'zscore', 'bg', 'localIdr', 'idr')
 
     def __init__(self, chrom, chromStart, chromEnd):
-        self.chrom = chrom
+        self.chrom = sys.intern(str(chrom)) # one string per chromosome name, shared by all entries
         self.chromStart = chromStart
         self.chromEnd = chromEnd
         self.usestrand = False
@@ -34,7 +44,9 @@ class BedEntry():
                   fold = None,
                   fdr = None,
                   zscore = None,
-                  bg = None):
+                  bg = None,
+                  localIdr = None,
+                  idr = None):
         if name: self.name = name
         if score != None: self.score = score
         if strand:
@@ -61,6 +73,8 @@ class BedEntry():
         if fdr != None: self.fdr = fdr
         if bg != None: self.bg = bg
         if zscore != None: self.zscore = zscore
+        if localIdr != None: self.localIdr = localIdr
+        if idr != None: self.idr = idr
 
     def __len__(self):
         if self.blocks:
@@ -178,6 +192,244 @@ def dist_promoter_or_enchancer(entry1, entry2, signed = False):
     return None
 
 
+def overlapJoin(qstarts, qends, starts, ends, maxends = None):
+    """ Find all overlapping pairs between query intervals and intervals sorted by start, in one go.
+        qstarts, qends: the query intervals (any order)
+        starts, ends: the intervals to search, sorted by start (e.g. BedColumns.starts and BedColumns.ends)
+        maxends: running maximum of ends (computed if not given, see BedColumns.maxends)
+        Returns (qidx, hidx, isectStart, isectEnd) as arrays with one element per overlapping pair,
+        ordered by query index, and by hit index within each query.
+    """
+    qstarts = np.asarray(qstarts, dtype = np.int64)
+    qends = np.asarray(qends, dtype = np.int64)
+    if maxends is None:
+        maxends = np.maximum.accumulate(ends) if len(ends) > 0 else ends
+    hi = np.searchsorted(starts, qends, side = 'left') # hits start before the query ends
+    lo = np.searchsorted(maxends, qstarts, side = 'right') # no hit before lo ends after the query starts
+    counts = np.maximum(hi - lo, 0)
+    qidx = np.repeat(np.arange(len(qstarts)), counts)
+    hidx = np.repeat(lo, counts) + (np.arange(len(qidx)) - np.repeat(np.cumsum(counts) - counts, counts))
+    keep = ends[hidx] > qstarts[qidx]
+    qidx = qidx[keep]
+    hidx = hidx[keep]
+    return qidx, hidx, np.maximum(qstarts[qidx], starts[hidx]), np.minimum(qends[qidx], ends[hidx])
+
+def closestJoin(qstarts, qends, starts, ends, k = 1, centre2centre = False):
+    """ Find the k intervals closest to each query interval, in one go (batched version of BedColumns.closest).
+        qstarts, qends: the query intervals (any order)
+        starts, ends: the intervals to search, sorted by start (e.g. BedColumns.starts and BedColumns.ends)
+        centre2centre: measure between the centres of the intervals instead of between their nearest ends (as dist)
+        Only the overlapping intervals and the k nearest on either side of each query are candidates, found with
+        searchsorted on the starts (right), the ends (left) or the centres.
+        Returns (qidx, hidx, distance) arrays with up to k elements per query, ordered by query index and then by
+        distance (ties by hit index). The distance is negative if the hit is before the query, 0 if they overlap
+        (int64, or float64 between centres).
+    """
+    qstarts = np.asarray(qstarts, dtype = np.int64)
+    qends = np.asarray(qends, dtype = np.int64)
+    n = len(starts)
+    if n == 0 or len(qstarts) == 0 or k < 1:
+        empty = np.zeros(0, dtype = np.int64)
+        return empty, empty, (empty.astype(np.float64) if centre2centre else empty)
+    steps = np.arange(k)
+    if centre2centre:
+        centres = starts + ends # twice the centre, to stay in integers
+        qcentres = qstarts + qends
+        rightorder = np.argsort(centres, kind = 'stable') # equal centres by index
+        leftorder = np.lexsort((-np.arange(n), centres)) # equal centres by index, from the end
+        at = np.searchsorted(centres[rightorder], qcentres, side = 'left')
+        sides = [(rightorder, at[:, None] + steps), (leftorder, at[:, None] - 1 - steps)]
+        qidx, hidx = [], []
+    else:
+        overlaps = overlapJoin(qstarts, qends, starts, ends)
+        qidx, hidx = [overlaps[0]], [overlaps[1]]
+        leftorder = np.lexsort((-np.arange(n), ends)) # equal ends by index, from the end
+        right = np.searchsorted(starts, qends, side = 'left') # first entry starting at or after the query end
+        left = np.searchsorted(ends[leftorder], qstarts, side = 'right') # entries ending at or before the query start
+        sides = [(None, right[:, None] + steps), (leftorder, left[:, None] - 1 - steps)]
+    for order, ranks in sides:
+        valid = (ranks >= 0) & (ranks < n)
+        qidx.append(np.nonzero(valid)[0])
+        hidx.append(ranks[valid] if order is None else order[ranks[valid]])
+    qidx = np.concatenate(qidx)
+    hidx = np.concatenate(hidx)
+    if centre2centre:
+        distance = centres[hidx] - qcentres[qidx]
+    else: # 0 for overlaps, the gap to hits after the query, minus the gap to hits before it
+        distance = np.where(starts[hidx] >= qends[qidx], starts[hidx] - qends[qidx], 0)
+        distance = np.where(ends[hidx] <= qstarts[qidx], ends[hidx] - qstarts[qidx], distance)
+    order = np.lexsort((hidx, np.abs(distance), qidx))
+    qidx, hidx, distance = qidx[order], hidx[order], distance[order]
+    first = np.concatenate(([True], (qidx[1:] != qidx[:-1]) | (hidx[1:] != hidx[:-1]))) # a hit found twice
+    qidx, hidx, distance = qidx[first], hidx[first], distance[first]
+    groups = np.flatnonzero(np.concatenate(([True], qidx[1:] != qidx[:-1])))
+    rank = np.arange(len(qidx)) - np.repeat(groups, np.diff(np.concatenate((groups, [len(qidx)]))))
+    keep = rank < k
+    if centre2centre:
+        return qidx[keep], hidx[keep], distance[keep] / 2
+    return qidx[keep], hidx[keep], distance[keep]
+
+def mergeIntervals(starts, ends):
+    """ Merge intervals sorted by start into their union (touching intervals are joined).
+        Returns (starts, ends) arrays of the disjoint merged intervals, in order.
+    """
+    starts = np.asarray(starts, dtype = np.int64)
+    ends = np.asarray(ends, dtype = np.int64)
+    if len(starts) == 0:
+        return starts, ends
+    maxends = np.maximum.accumulate(ends)
+    first = np.concatenate(([True], starts[1:] > maxends[:-1])) # starts a new merged interval
+    last = np.concatenate((first[1:], [True]))
+    return starts[first], maxends[last]
+
+def unionIntervals(*intervals):
+    """ Union of any number of (starts, ends) pairs of intervals (in any order), as for mergeIntervals. """
+    starts = np.concatenate([np.asarray(pair[0], dtype = np.int64) for pair in intervals])
+    ends = np.concatenate([np.asarray(pair[1], dtype = np.int64) for pair in intervals])
+    order = np.argsort(starts, kind = 'stable')
+    return mergeIntervals(starts[order], ends[order])
+
+def intersectIntervals(astarts, aends, bstarts, bends):
+    """ Intersection of two sets of disjoint intervals sorted by start (e.g. from mergeIntervals).
+        Returns (starts, ends) arrays of the disjoint intersected intervals, in order.
+    """
+    bstarts = np.asarray(bstarts, dtype = np.int64)
+    bends = np.asarray(bends, dtype = np.int64)
+    qidx, hidx, isectStart, isectEnd = overlapJoin(astarts, aends, bstarts, bends, bends)
+    return isectStart, isectEnd
+
+def complementIntervals(starts, ends, size):
+    """ The gaps in [0, size) between disjoint intervals sorted by start (e.g. from mergeIntervals).
+        Returns (starts, ends) arrays of the gaps, in order.
+    """
+    gapstarts = np.concatenate(([0], np.asarray(ends, dtype = np.int64)))
+    gapends = np.concatenate((np.asarray(starts, dtype = np.int64), [size]))
+    gapstarts = np.minimum(gapstarts, size)
+    gapends = np.minimum(gapends, size)
+    keep = gapends > gapstarts
+    return gapstarts[keep], gapends[keep]
+
+def subtractIntervals(astarts, aends, bstarts, bends):
+    """ The bases of disjoint intervals a that are not in disjoint intervals b (both sorted by start, e.g. from mergeIntervals).
+        Returns (starts, ends) arrays of what remains of a, in order.
+    """
+    size = max(int(aends[-1]) if len(aends) > 0 else 0, int(bends[-1]) if len(bends) > 0 else 0)
+    gaps = complementIntervals(bstarts, bends, size)
+    return intersectIntervals(astarts, aends, gaps[0], gaps[1])
+
+def intervalBases(intervals):
+    """ The number of bases in a dictionary of disjoint (starts, ends) per chromosome (e.g. from BedFile.merged). """
+    n = 0
+    for chrom in intervals:
+        n += int(np.sum(intervals[chrom][1] - intervals[chrom][0]))
+    return n
+
+class BedColumns:
+    """ The entries of one chromosome stored column by column in NumPy arrays, sorted by chromStart.
+        Used by BedFile(..., backend = 'columnar') in place of an ival.IntervalTree, to avoid one
+        BedEntry instance per row. Entries are only created (as BedEntry) when requested.
+
+        starts, ends: chromStart and chromEnd of each entry (int64)
+        fields: dictionary of optional BED fields (e.g. 'pValue', 'name') with one value per entry
+    """
+
+    # optional fields that can be kept as columns (as named by BedEntry.addOption)
+    FIELDS = ('name', 'score', 'strand', 'signalValue', 'pValue', 'qValue', 'peak', 'thickStart', 'thickEnd',
+              'summit', 'tags', 'fold', 'fdr', 'zscore', 'bg', 'localIdr', 'idr')
+
+    def __init__(self, chrom, starts, ends, fields = None):
+        order = np.argsort(starts, kind = 'stable')
+        self.chrom = chrom
+        self.starts = np.asarray(starts, dtype = np.int64)[order]
+        self.ends = np.asarray(ends, dtype = np.int64)[order]
+        self.fields = dict()
+        if fields:
+            for field in fields:
+                self.fields[field] = np.asarray(fields[field])[order]
+        # running maximum of chromEnd, so that overlap queries can be answered by binary search
+        self.maxends = np.maximum.accumulate(self.ends) if len(self.ends) > 0 else self.ends
+
+    @staticmethod
+    def fromEntries(chrom, entries):
+        """ Create the columns from BedEntry instances (all on chromosome chrom). """
+        entries = list(entries)
+        fields = dict()
+        for field in BedColumns.FIELDS:
+            values = [getattr(entry, field, None) for entry in entries]
+            if field == 'name' or field == 'strand':
+                values = [value if value else None for value in values]
+            if all(value is None for value in values):
+                continue
+            if any(value is None for value in values) or isinstance(values[0], str):
+                fields[field] = np.array(values, dtype = object)
+            else:
+                fields[field] = np.array(values)
+        for entry in entries:
+            if entry.blocks:
+                raise RuntimeError('Blocks are not supported by columnar BED entries \"%s\"' % str(entry))
+        return BedColumns(chrom, [entry.chromStart for entry in entries], [entry.chromEnd for entry in entries], fields)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def entry(self, i):
+        """ Create the BedEntry for the i-th entry (in chromStart order). """
+        entry = BedEntry(self.chrom, int(self.starts[i]), int(self.ends[i]))
+        options = dict()
+        for field in self.fields:
+            value = self.fields[field][i]
+            if value is not None:
+                options[field] = value.item() if isinstance(value, np.generic) else value
+        if options:
+            entry.addOption(**options)
+        return entry
+
+    def __iter__(self):
+        for i in range(len(self.starts)):
+            yield self.entry(i)
+
+    def overlap(self, start, end):
+        """ Return the indices of the entries that overlap the interval [start, end). """
+        hi = np.searchsorted(self.starts, end, side = 'left') # entries starting before end
+        lo = np.searchsorted(self.maxends, start, side = 'right') # none before lo ends after start
+        idx = np.arange(lo, hi)
+        return idx[self.ends[lo:hi] > start]
+
+    def score(self, field):
+        """ The values of an optional field as a float64 array (NaN for entries without a value). """
+        values = self.fields.get(field)
+        if values is None:
+            raise RuntimeError('No %s field on %s' % (field, self.chrom))
+        if values.dtype == object:
+            return np.array([np.nan if value is None else value for value in values], dtype = np.float64)
+        return values.astype(np.float64)
+
+    def contains(self, start, end):
+        """ True if an entry with exactly this interval is stored. """
+        lo = np.searchsorted(self.starts, start, side = 'left')
+        hi = np.searchsorted(self.starts, start, side = 'right')
+        return bool(np.any(self.ends[lo:hi] == end))
+
+    def closest(self, start, end):
+        """ Return the index of the entry closest to [start, end) (an overlapping one if any), or None if empty. """
+        hits = self.overlap(start, end)
+        if len(hits) > 0:
+            return int(hits[0])
+        best = None
+        left = np.searchsorted(self.maxends, start, side = 'right') - 1 # last entry that may end before start
+        if left >= 0:
+            candidates = np.arange(left + 1)
+            candidates = candidates[self.ends[:left + 1] <= start]
+            if len(candidates) > 0:
+                nearest = candidates[np.argmax(self.ends[candidates])]
+                best = (start - self.ends[nearest], int(nearest))
+        right = np.searchsorted(self.starts, end, side = 'left') # first entry starting at or after end
+        if right < len(self.starts):
+            if best == None or self.starts[right] - end < best[0]:
+                best = (self.starts[right] - end, int(right))
+        return best[1] if best != None else None
+
+
 class BedFile:
     """ Read BED file.
 
@@ -234,16 +486,46 @@ class BedFile:
 
     """
 
-    def __init__(self, entries, format = 'Limited',chr='chr1'):
+    def __init__(self, entries, format = 'Limited',chr='chr1', backend = 'tree', cache = False):
         """
         Create a BedFile instance.
         :param entries: an iterable of entries or a filename
         :param format: the format of the BED file
+        :param backend: 'tree' keeps BedEntry instances in an ival.IntervalTree per chromosome,
+            'columnar' keeps the entries in NumPy arrays per chromosome (BedColumns)
+        :param cache: with the columnar backend, keep the parsed file in a binary sidecar file (see bedCacheFilename)
+            that is re-used as long as the file has the same path, modification time, size and format;
+            for BedGraph files, keep an index of the file (see indexBedGraph) so that chromosome chr is read directly
+            (without cache, the index is only kept in memory, see getBedGraphIndex)
         """
         self.format = format
-        if isinstance(entries, str): # filename
+        self.backend = backend
+        self.summary = None # see stats
+        self.merges = None # see merged
+        self.scorecache = dict() # see scores
+        self.pending = dict() # entries added to the columnar backend since the last query, see addEntry
+        self.columncache = dict() # tree backend, see columns
+        if backend == 'columnar':
+            self.chroms = None
+            if format == 'BedGraph':
+                index = getBedGraphIndex(entries, save = cache)
+                columns = readBedGraphRegion(entries, chr, index = index)
+                self.chroms = dict([(chr, columns)]) if columns != None else dict()
+            elif isinstance(entries, str): # filename
+                filename = entries
+                if cache:
+                    self.chroms = loadBedCache(filename, format)
+                if self.chroms == None:
+                    self.chroms = readBedColumns(filename, format)
+                    if self.chroms == None: # not a fixed-column format
+                        self.chroms = packBedColumns(readBedEntries(filename, format))
+                    if cache: # only on a miss, so readers of an up-to-date cache file never see it rewritten
+                        saveBedCache(self.chroms, filename, format)
+            else:
+                self.chroms = packBedColumns(entries)
+        elif isinstance(entries, str): # filename
             if format == 'BedGraph':
-                self.chroms = readBedGraphFile(entries,chr)
+                self.chroms = readBedGraphFile(entries,chr,index = cache)
             
             else:
                 self.chroms = readBedFile(entries, format)
@@ -260,17 +542,175 @@ class BedFile:
                 tree.put(iv, entry)
 
     def __len__(self):
+        self.pack()
         n = 0
         for c in self.chroms:
             n += len(self.chroms[c])
         return n
 
+    def stats(self):
+        """ Summary statistics of the entries, computed on first use and kept until the BedFile is changed (see addEntry).
+            Returns a dictionary with
+            'entries': the number of entries,
+            'bases': the summed length of the entries,
+            'coverage': the number of bases covered by at least one entry (overlaps counted once),
+            'spans': a dictionary with the (lowest chromStart, highest chromEnd) of each chromosome
+        """
+        if self.summary == None:
+            summary = {'entries': 0, 'bases': 0, 'coverage': 0, 'spans': dict()}
+            merges = self.merged()
+            for chrom in merges:
+                starts, ends = self.intervals(chrom)
+                merged = merges[chrom]
+                summary['entries'] += len(starts)
+                summary['bases'] += int(np.sum(ends - starts))
+                summary['coverage'] += int(np.sum(merged[1] - merged[0]))
+                summary['spans'][chrom] = (int(starts[0]), int(merged[1][-1]))
+            self.summary = summary
+        return self.summary
+
+    def merged(self):
+        """ The union of the entries, computed on first use and kept until the BedFile is changed (see addEntry).
+            Returns a dictionary with the (starts, ends) arrays of the disjoint merged intervals of each chromosome
+            (touching entries are joined, chromosomes without entries are left out).
+        """
+        if self.merges == None:
+            merges = dict()
+            for chrom in self.chroms:
+                intervals = self.intervals(chrom)
+                if intervals == None or len(intervals[0]) == 0:
+                    continue
+                merges[chrom] = mergeIntervals(*intervals)
+            self.merges = merges
+        return self.merges
+
+    def scores(self, field):
+        """ The values of an optional field (e.g. 'pValue', 'qValue', 'signalValue', 'score' or 'idr' of IDR output) as float64 arrays,
+            extracted on first use and kept until the BedFile is changed (see addEntry).
+            Returns a dictionary with an array for each chromosome, in the order of self.columns(chrom).
+        """
+        if field not in self.scorecache:
+            scores = dict()
+            for chrom in self.chroms:
+                columns = self.columns(chrom)
+                if columns != None and len(columns) > 0:
+                    scores[chrom] = columns.score(field)
+            self.scorecache[field] = scores
+        return self.scorecache[field]
+
+    def ranking(self, field, ascending = True):
+        """ Rank the entries by the values of an optional field, lowest first if ascending and highest first otherwise.
+            Returns (chroms, idx): the chromosome and the index into self.columns(chrom) of every entry, in ranking
+            order; entries with the same value keep the order of the chromosomes (sorted) and of their starts.
+        """
+        scores = self.scores(field)
+        chroms = sorted(scores.keys())
+        if len(chroms) == 0:
+            return np.zeros(0, dtype = object), np.zeros(0, dtype = np.int64)
+        values = np.concatenate([scores[chrom] for chrom in chroms])
+        order = np.argsort(values if ascending else -values, kind = 'stable')
+        names = np.repeat(np.array(chroms, dtype = object), [len(scores[chrom]) for chrom in chroms])
+        idx = np.concatenate([np.arange(len(scores[chrom])) for chrom in chroms])
+        return names[order], idx[order]
+
+    def union(self, *others):
+        """ The bases covered by the entries of this or any of the other BedFile instances, as for merged. """
+        ret = dict(self.merged())
+        for other in others:
+            for chrom, merged in other.merged().items():
+                ret[chrom] = unionIntervals(ret[chrom], merged) if chrom in ret else merged
+        return ret
+
+    def intersect(self, other):
+        """ The bases covered by the entries of both this and the other BedFile, as for merged. """
+        ret = dict()
+        mine = self.merged()
+        for chrom, merged in other.merged().items():
+            if chrom in mine:
+                isect = intersectIntervals(mine[chrom][0], mine[chrom][1], merged[0], merged[1])
+                if len(isect[0]) > 0:
+                    ret[chrom] = isect
+        return ret
+
+    def subtract(self, other):
+        """ The bases covered by the entries of this but not the other BedFile, as for merged. """
+        ret = dict()
+        theirs = other.merged()
+        for chrom, merged in self.merged().items():
+            if chrom in theirs:
+                merged = subtractIntervals(merged[0], merged[1], theirs[chrom][0], theirs[chrom][1])
+            if len(merged[0]) > 0:
+                ret[chrom] = merged
+        return ret
+
+    def complement(self, genome):
+        """ The bases of a genome not covered by the entries, as for merged.
+            genome: a dictionary with the size of each chromosome, or the name of a genome size file (see readGenomeSizes)
+        """
+        if isinstance(genome, str):
+            genome = readGenomeSizes(genome)
+        ret = dict()
+        mine = self.merged()
+        for chrom in genome:
+            if chrom in mine:
+                gaps = complementIntervals(mine[chrom][0], mine[chrom][1], genome[chrom])
+            else:
+                gaps = complementIntervals([], [], genome[chrom])
+            if len(gaps[0]) > 0:
+                ret[chrom] = gaps
+        return ret
+
+    @staticmethod
+    def fromIntervals(intervals, format = 'Limited'):
+        """ Create a (columnar) BedFile from a dictionary with (starts, ends) arrays per chromosome, e.g. from merged. """
+        bf = BedFile([], format, backend = 'columnar')
+        for chrom in intervals:
+            if len(intervals[chrom][0]) > 0:
+                bf.chroms[chrom] = BedColumns(chrom, intervals[chrom][0], intervals[chrom][1])
+        return bf
+
+    def addEntry(self, entry):
+        """ Add a BedEntry, statistics and columns kept for the previous entries are discarded.
+            With the columnar backend the entry is held back until the chromosome is next queried (see pack), so that
+            adding n entries in a row repacks each chromosome once rather than n times.
+        """
+        tree = self.chroms.get(entry.chrom)
+        if self.backend == 'columnar':
+            if tree == None:
+                self.chroms[entry.chrom] = BedColumns(entry.chrom, [], []) # until packed
+            self.pending.setdefault(entry.chrom, []).append(entry)
+        else:
+            if tree == None:
+                tree = ival.IntervalTree()
+                self.chroms[entry.chrom] = tree
+            tree.put(ival.Interval(entry.chromStart, entry.chromEnd), entry)
+            self.columncache.pop(entry.chrom, None)
+        self.summary = None
+        self.merges = None
+        self.scorecache = dict()
+
+    def pack(self, chrom = None):
+        """ Columnar backend: merge the entries added since the last query (see addEntry) into the columns of their
+            chromosome, for chromosome chrom or for all of them. Does nothing for the tree backend.
+        """
+        if not self.pending:
+            return
+        for name in ([chrom] if chrom != None else list(self.pending)):
+            entries = self.pending.pop(name, None)
+            if entries:
+                self.chroms[name] = BedColumns.fromEntries(name, list(self.chroms[name]) + entries)
+
     def generate(self, chrom):
+        self.pack(chrom)
         mytree = self.chroms.get(chrom)
         if mytree != None:
-            for e in mytree:
-                for entry in e.values:
+            if self.backend == 'columnar':
+                for entry in mytree:
                     yield entry
+            else:
+                for e in mytree:
+                    for entry in e.values:
+                        yield entry
 
     def __iter__(self):
         self.chromqueue = ival.Stack()
@@ -292,16 +732,21 @@ class BedFile:
 
     def __contains__(self, item):
         if isinstance(item, BedEntry):
+            self.pack(item.chrom)
             tree = self.chroms.get(item.chrom)
             if tree == None: return False
+            elif self.backend == 'columnar': return tree.contains(item.chromStart, item.chromEnd)
             else: return ival.Interval(item.chromStart, item.chromEnd) in tree
         else:
             return False
 
     def getOverlap(self, item):
         if isinstance(item, BedEntry):
+            self.pack(item.chrom)
             tree = self.chroms.get(item.chrom)
             if tree == None: return None
+            elif self.backend == 'columnar':
+                return [tree.entry(i) for i in tree.overlap(item.chromStart, item.chromEnd)]
             else:
                 iv = ival.Interval(item.chromStart, item.chromEnd)
                 res = tree.isectall(iv)
@@ -311,10 +756,105 @@ class BedFile:
                 return ret
         else: return None
 
+    def columns(self, chrom):
+        """ Return the entries of a chromosome as BedColumns (None if there are none), for either backend.
+            The indices reported by overlapMany and overlapIntervals refer to the order of these columns.
+        """
+        if self.backend == 'columnar':
+            self.pack(chrom)
+            return self.chroms.get(chrom)
+        if chrom not in self.chroms:
+            return None
+        if chrom not in self.columncache:
+            self.columncache[chrom] = BedColumns.fromEntries(chrom, self.generate(chrom))
+        return self.columncache[chrom]
+
+    def intervals(self, chrom):
+        """ Return the (starts, ends) arrays of the entries of a chromosome in chromStart order (None if there are none),
+            for either backend. Unlike columns, the tree backend takes them from the entries as they are, without
+            packing (and keeping) their optional fields, so entries with blocks are accepted.
+        """
+        if self.backend == 'columnar' or chrom in self.columncache:
+            columns = self.columns(chrom)
+            return None if columns == None else (columns.starts, columns.ends)
+        if chrom not in self.chroms:
+            return None
+        pairs = np.array([(entry.chromStart, entry.chromEnd) for entry in self.generate(chrom)], dtype = np.int64).reshape(-1, 2)
+        order = np.argsort(pairs[:, 0], kind = 'stable')
+        return pairs[order, 0], pairs[order, 1]
+
+    def overlapIntervals(self, chrom, starts, ends):
+        """ Batched version of getOverlap for intervals on one chromosome.
+            starts, ends: the query intervals
+            Returns (qidx, hidx, isectStart, isectEnd) arrays with one element per overlapping pair of
+            query qidx and entry hidx (an index into self.columns(chrom)), and the intersection of the two.
+        """
+        columns = self.columns(chrom)
+        if columns == None:
+            empty = np.zeros(0, dtype = np.int64)
+            return empty, empty, empty, empty
+        return overlapJoin(starts, ends, columns.starts, columns.ends, columns.maxends)
+
+    def overlapMany(self, query):
+        """ Batched version of getOverlap for all entries of another BedFile.
+            Returns a dictionary with (qidx, hidx, isectStart, isectEnd) arrays (see overlapIntervals) for every
+            chromosome of query, where qidx indexes query.columns(chrom) and hidx indexes self.columns(chrom).
+        """
+        ret = dict()
+        for chrom in query.chroms:
+            qcolumns = query.columns(chrom)
+            ret[chrom] = self.overlapIntervals(chrom, qcolumns.starts, qcolumns.ends)
+        return ret
+
+    def closestIntervals(self, chrom, starts, ends, k = 1, signed = True, centre2centre = False):
+        """ Batched version of getClosest for intervals on one chromosome, see closestJoin.
+            starts, ends: the query intervals
+            k: the number of closest entries to report for each query
+            signed: if False, distances are not negative
+            Returns (qidx, hidx, distance) arrays with up to k elements per query, nearest first, where hidx is an
+            index into self.columns(chrom).
+        """
+        columns = self.columns(chrom)
+        if columns == None:
+            empty = np.zeros(0, dtype = np.int64)
+            return empty, empty, (empty.astype(np.float64) if centre2centre else empty)
+        qidx, hidx, distance = closestJoin(starts, ends, columns.starts, columns.ends, k, centre2centre)
+        if not signed:
+            distance = np.abs(distance)
+        return qidx, hidx, distance
+
+    def closestMany(self, query, k = 1, signed = True, centre2centre = False, fromcentre = False):
+        """ Batched version of getClosest for all entries of another BedFile, e.g. to annotate every peak with its
+            nearest promoter or enhancer.
+            k: the number of closest entries to report for each query entry
+            signed: if True, the distance is negative if the entry of self is before the query entry (as dist)
+            centre2centre: measure between centres instead of between the nearest ends (as dist)
+            fromcentre: measure from the centre of each query entry (rounded down) to the nearest end of the entries
+                of self, as dist_promoter_or_enchancer does from the middle of an interval
+            Returns a dictionary with (qidx, hidx, distance) arrays (see closestIntervals) for every chromosome of
+            query, where qidx indexes query.columns(chrom) and hidx indexes self.columns(chrom); query entries on
+            chromosomes without entries in self have no rows.
+        """
+        ret = dict()
+        for chrom in query.chroms:
+            qcolumns = query.columns(chrom)
+            if qcolumns == None:
+                continue
+            starts, ends = qcolumns.starts, qcolumns.ends
+            if fromcentre:
+                starts = ends = (starts + ends) // 2
+            ret[chrom] = self.closestIntervals(chrom, starts, ends, k, signed, centre2centre)
+        return ret
+
     def getClosest(self, item):
         if isinstance(item, BedEntry):
+            self.pack(item.chrom)
             tree = self.chroms.get(item.chrom)
             if tree == None: return None
+            elif self.backend == 'columnar':
+                i = tree.closest(item.chromStart, item.chromEnd)
+                if i != None: return [tree.entry(i)]
+                else: return None
             else:
                 iv = ival.Interval(item.chromStart, item.chromEnd)
                 node = tree.closest(iv)
@@ -370,11 +910,318 @@ def readBedFile(filename, format = 'Limited'):
             chr1    921184    18
             chr1    931838    9
     """
+    chroms = dict()
+    for entry in readBedEntries(filename, format):
+        # check if the chromosome has been seen before
+        tree = chroms.get(entry.chrom)
+        if not tree:
+            tree = ival.IntervalTree()
+            chroms[entry.chrom] = tree
+        # put the entry in the interval tree for the appropriate chromosome
+        iv = ival.Interval(entry.chromStart, entry.chromEnd)
+        tree.put(iv, entry)
+    return chroms
+
+def bedColumnSpec(format, ncols):
+    """ Resolve a fixed-column BED format once per file, for readBedColumns.
+        format: see readBedFile; ncols: the number of columns of the rows
+        Returns [(field, column, type), ...] with the optional fields held by the format (as parsed by readBedEntries),
+        or None if the format has no fixed layout (its rows need to be parsed one by one).
+    """
+    fmt = format.lower()
+    if fmt.startswith('ccat') or fmt.startswith('opt') or fmt.startswith('bed12') or fmt.startswith('strand') or fmt.startswith('crop'):
+        return None
+    if fmt.startswith('bed6'):
+        return [('name', 3, str), ('score', 4, float), ('strand', 5, str)]
+    if fmt.startswith('peak'):
+        spec = [('name', 3, str), ('score', 4, int), ('strand', 5, str), ('signalValue', 6, float), ('pValue', 7, float), ('qValue', 8, float)]
+        if ncols >= 10: # narrowpeaks
+            spec.append(('peak', 9, int))
+        return spec
+    if fmt == 'idr':
+        spec = [('name', 3, str), ('score', 6, float), ('pValue', 7, float)]
+        if ncols >= 12: # IDR output, with -log10 of the local and global IDR
+            spec.extend([('localIdr', 10, float), ('idr', 11, float)])
+        return spec
+    if fmt.startswith('summit'):
+        spec = [('summit', 4, int), ('tags', 5, int), ('pValue', 6, float), ('fold', 7, float)]
+        if ncols >= 9:
+            spec.append(('fdr', 8, float))
+        return spec
+    return [] # Limited
+
+def readBedChunks(filename, format = 'Limited', chunksize = 1 << 26):
+    """ Generator over the rows of a fixed-column BED file ("Limited", "BED6", "Peaks", "idr" and "Summit"), in chunks.
+        Reads the file in chunks of about chunksize bytes, splits the rows of a chunk in one go and converts
+        every column with a single NumPy call, instead of parsing the rows one by one.
+        Yields (chroms, starts, ends, fields) per chunk, with an array per column and fields a dictionary of the
+        optional fields of the format (see bedColumnSpec), in file order.
+        Yields None and stops if the format is not fixed-column or the rows differ in width; use readBedEntries for those.
+    """
+    if bedColumnSpec(format, 0) == None:
+        yield None
+        return
+    ncols = None
+    spec = None
+    f = open(filename)
+    try:
+        while True:
+            lines = f.readlines(chunksize)
+            if not lines:
+                break
+            text = ''.join(lines)
+            if '#' in text or 'browser' in text or 'track' in text:
+                lines = [line for line in lines if not line.lstrip().startswith(('#', 'browser', 'track'))]
+                text = ''.join(lines)
+            words = text.split() # all rows of the chunk in one go
+            if not words:
+                continue
+            if len(words) % len(lines) != 0:
+                lines = [line for line in lines if line.strip()] # ignore empty lines
+            if ncols == None:
+                ncols = len(lines[0].split())
+                spec = bedColumnSpec(format, ncols)
+                if ncols < 3 or any(col >= ncols for field, col, type in spec):
+                    yield None # too few columns, leave the error to readBedEntries
+                    return
+            if len(words) != ncols * len(lines): # rows of different widths
+                yield None
+                return
+            fields = dict()
+            for field, col, type in spec:
+                if type == str:
+                    fields[field] = np.array(words[col::ncols], dtype = object)
+                else:
+                    fields[field] = np.array(words[col::ncols], dtype = np.int64 if type == int else np.float64)
+            yield np.array(words[0::ncols]), np.array(words[1::ncols], dtype = np.int64), np.array(words[2::ncols], dtype = np.int64), fields
+    finally:
+        f.close()
+
+def readBedColumns(filename, format = 'Limited', chunksize = 1 << 26):
+    """ Bulk parser for the fixed-column formats ("Limited", "BED6", "Peaks", "idr" and "Summit"), see readBedChunks.
+        Returns a dictionary with a BedColumns instance per chromosome (see BedFile(..., backend = 'columnar')),
+        or None if the format is not fixed-column or the rows differ in width; use readBedEntries for those.
+    """
+    chunks = []
+    for chunk in readBedChunks(filename, format, chunksize):
+        if chunk is None:
+            return None
+        chunks.append(chunk)
+    if not chunks:
+        return dict()
+
+    chroms = np.concatenate([chunk[0] for chunk in chunks])
+    starts = np.concatenate([chunk[1] for chunk in chunks])
+    ends = np.concatenate([chunk[2] for chunk in chunks])
+    fields = dict()
+    for field in chunks[0][3]:
+        fields[field] = np.concatenate([chunk[3][field] for chunk in chunks])
+    # chromosome codes, from the runs of identical names (a single run per chromosome in sorted files)
+    runs = np.concatenate(([0], np.flatnonzero(chroms[1:] != chroms[:-1]) + 1))
+    runnames = chroms[runs].tolist()
+    index = dict()
+    for name in runnames:
+        if name not in index:
+            index[name] = len(index)
+    names = list(index)
+    codes = np.repeat([index[name] for name in runnames], np.diff(np.append(runs, len(chroms))))
+    order = np.argsort(codes, kind = 'stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    out = dict()
+    for c in range(len(names)):
+        rows = order[bounds[c]:bounds[c + 1]]
+        out[names[c]] = BedColumns(names[c], starts[rows], ends[rows], dict([(field, fields[field][rows]) for field in fields]))
+    return out
+
+def scanBedChroms(filename, chunksize = 1 << 26):
+    """ The chromosomes of a BED file in the order they first appear, without parsing the rows (e.g. to check that
+        several files sorted by chromosome share an order before iterBedChroms reads them).
+        Only the first word of each line is read; the chromosome changes within each chunk of the file are the runs
+        of identical names (as in iterBedChroms). Blank lines, comments and browser/track lines are skipped.
+        Raises RuntimeError if the rows of a chromosome are not contiguous.
+    """
+    names = []
+    seen = set()
+    f = open(filename)
+    try:
+        while True:
+            lines = f.readlines(chunksize)
+            if not lines:
+                break
+            words = [line.split(None, 1)[0] for line in lines if line.strip()]
+            words = [word for word in words if not word.startswith(('#', 'browser', 'track'))]
+            if not words:
+                continue
+            chroms = np.array(words)
+            runs = np.concatenate(([0], np.flatnonzero(chroms[1:] != chroms[:-1]) + 1))
+            for chrom in chroms[runs].tolist():
+                if len(names) > 0 and chrom == names[-1]:
+                    continue
+                if chrom in seen:
+                    raise RuntimeError('BED file %s is not sorted by chromosome (%s)' % (filename, chrom))
+                seen.add(chrom)
+                names.append(chrom)
+    finally:
+        f.close()
+    return names
+
+def iterBedChroms(filename, format = 'Limited', chunksize = 1 << 26):
+    """ Generator over the chromosomes of a BED file sorted by chromosome (e.g. with sort -k1,1 -k2,2n or bedtools sort),
+        for files too large to load in full. Only one chromosome (and one chunk of the file) is held at a time.
+        Yields (chrom, BedColumns) for each chromosome, in file order.
+        Raises RuntimeError if the rows of a chromosome are not contiguous.
+    """
+    seen = set()
+    current = None
+    parts = [] # (starts, ends, fields) of the current chromosome
+    def finish():
+        seen.add(current)
+        fields = dict()
+        for field in parts[0][2]:
+            fields[field] = np.concatenate([part[2][field] for part in parts])
+        return current, BedColumns(current, np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]), fields)
+
+    chunks = readBedChunks(filename, format, chunksize)
+    first = next(chunks, None)
+    if first is None: # empty, or not a fixed-column format
+        entries = []
+        for entry in readBedEntries(filename, format):
+            if entry.chrom != current:
+                if entries:
+                    yield current, BedColumns.fromEntries(current, entries)
+                    seen.add(current)
+                if entry.chrom in seen:
+                    raise RuntimeError('BED file %s is not sorted by chromosome (%s)' % (filename, entry.chrom))
+                current = entry.chrom
+                entries = []
+            entries.append(entry)
+        if entries:
+            yield current, BedColumns.fromEntries(current, entries)
+        return
+
+    for chroms, starts, ends, fields in itertools.chain([first], chunks):
+        runs = np.concatenate(([0], np.flatnonzero(chroms[1:] != chroms[:-1]) + 1, [len(chroms)]))
+        for r in range(len(runs) - 1):
+            lo, hi = runs[r], runs[r + 1]
+            chrom = str(chroms[lo])
+            if chrom != current:
+                if parts:
+                    yield finish()
+                if chrom in seen:
+                    raise RuntimeError('BED file %s is not sorted by chromosome (%s)' % (filename, chrom))
+                current = chrom
+                parts = []
+            parts.append((starts[lo:hi], ends[lo:hi], dict([(field, fields[field][lo:hi]) for field in fields])))
+    if parts:
+        yield finish()
+
+def packBedColumns(entries):
+    """ Pack BedEntry instances into columns, returns a dictionary with a BedColumns instance per chromosome.
+        entries: an iterable of entries, e.g. from readBedEntries
+    """
+    bychrom = dict()
+    for entry in entries:
+        rows = bychrom.get(entry.chrom)
+        if rows == None:
+            rows = []
+            bychrom[entry.chrom] = rows
+        rows.append(entry)
+    chroms = dict()
+    for chrom in bychrom:
+        chroms[chrom] = BedColumns.fromEntries(chrom, bychrom[chrom])
+    return chroms
+
+def bedCacheFilename(filename, format):
+    """ Name of the binary sidecar file that caches the columns of BED file filename, parsed as format. """
+    return filename + '.' + format.lower() + '.npz'
+
+def bedCacheKey(filename, format):
+    """ The key that a cache file must match to be used: the path, modification time and size of the file, and the format. """
+    stat = os.stat(filename)
+    return '%s|%d|%d|%s|2' % (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, format.lower())
+
+def saveBedCache(chroms, filename, format):
+    """ Save the columns (a dictionary of BedColumns, e.g. from readBedColumns) of a BED file to its cache file.
+        The file is written under a temporary name and then renamed (see saveArrays), so that processes loading the
+        same BED file at the same time see either the old cache file or the complete new one.
+        Returns False if the columns can not be cached (e.g. the directory is not writable).
+    """
+    names = sorted(chroms.keys())
+    columns = [chroms[chrom] for chrom in names]
+    arrays = dict()
+    arrays['key'] = np.array(bedCacheKey(filename, format))
+    arrays['chroms'] = np.array(names, dtype = str)
+    arrays['offsets'] = np.cumsum([0] + [len(column) for column in columns])
+    arrays['starts'] = np.concatenate([column.starts for column in columns] + [np.zeros(0, dtype = np.int64)])
+    arrays['ends'] = np.concatenate([column.ends for column in columns] + [np.zeros(0, dtype = np.int64)])
+    fields = set()
+    for column in columns:
+        fields.update(column.fields.keys())
+    for field in fields:
+        if not all(field in column.fields for column in columns):
+            return False
+        values = np.concatenate([column.fields[field] for column in columns])
+        if values.dtype == object:
+            if any(value is None or not isinstance(value, str) for value in values):
+                return False
+            values = values.astype(str)
+        arrays['field_' + field] = values
+    return saveArrays(bedCacheFilename(filename, format), arrays)
+
+def saveArrays(filename, arrays):
+    """ Save a dictionary of arrays as an .npz file under a temporary name and rename it to filename, so that
+        processes reading filename at the same time see either the old file or the complete new one.
+        The temporary name is hidden and ends with .npz, so a file left behind by a crash is skipped by folder
+        listings that skip caches (e.g. ROCCurve.get_prefixes).
+        Returns False if the file can not be written (e.g. the directory is not writable).
+    """
+    try:
+        fd, tmpname = tempfile.mkstemp(suffix = '.tmp.npz', prefix = '.' + os.path.basename(filename) + '.', dir = os.path.dirname(os.path.abspath(filename)))
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpname, filename)
+    except (OSError, ValueError):
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        return False
+    return True
+
+def loadBedCache(filename, format):
+    """ Load the columns of a BED file from its cache file.
+        Returns a dictionary with a BedColumns instance per chromosome, or None if there is no (up-to-date) cache file;
+        an unreadable (e.g. truncated) cache file is treated the same way.
+    """
+    cachename = bedCacheFilename(filename, format)
+    if not os.path.exists(cachename):
+        return None
+    try:
+        arrays = np.load(cachename, allow_pickle = False)
+        if str(arrays['key']) != bedCacheKey(filename, format):
+            return None
+        names = arrays['chroms'].tolist()
+        offsets = arrays['offsets']
+        starts = arrays['starts']
+        ends = arrays['ends']
+        fields = dict([(key[len('field_'):], arrays[key]) for key in arrays.files if key.startswith('field_')])
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return None
+    chroms = dict()
+    for c in range(len(names)):
+        lo, hi = offsets[c], offsets[c + 1]
+        chroms[names[c]] = BedColumns(names[c], starts[lo:hi], ends[lo:hi], dict([(field, fields[field][lo:hi]) for field in fields]))
+    return chroms
+
+def readBedEntries(filename, format = 'Limited'):
+    """ Generator over the entries (BedEntry) of a BED file, in file order.
+        format: see readBedFile
+    """
     f = open(filename)
     row = 0
     acceptHeaderRows = 1
     headerRow = None
-    chroms = dict()
     for line in f:
         row += 1
         words = line.strip().split()
@@ -423,6 +1270,8 @@ def readBedFile(filename, format = 'Limited'):
 
             elif format.lower() == 'idr': # idr - ADDED Richard
                 entry.addOption(name = words[3], score = float(words[6]), pValue = float(words[7]))
+                if len(words) >= 12: # IDR output, with -log10 of the local and global IDR
+                    entry.addOption(localIdr = float(words[10]), idr = float(words[11]))
             elif format.lower().startswith('summit'):
                 if len(words) >= 9:
                     entry.addOption(summit = int(words[4]), tags = int(words[5]), pValue = float(words[6]), fold = float(words[7]), fdr = float(words[8]))
@@ -433,26 +1282,50 @@ def readBedFile(filename, format = 'Limited'):
             elif format.lower().startswith('crop'):
                 entry.addOption(score = int(words[2]), name = '.', strand = '.')
                 entry.chromEnd = entry.chromStart + 1
-            # check if the chromosome has been seen before
-            tree = chroms.get(chrom)
-            if not tree:
-                tree = ival.IntervalTree()
-                chroms[chrom] = tree
-            # put the entry in the interval tree for the appropriate chromosome
-            iv = ival.Interval(entry.chromStart, entry.chromEnd)
-            tree.put(iv, entry)
         except RuntimeError as e:
             if not acceptHeaderRows:
                 raise RuntimeError('Error in BED file at row %d (%s)' % (row, e.strerror))
             else:
                 headerRow = words
                 acceptHeaderRows -= 1 # count down the number of header rows that can occur
+            continue
+        yield entry
     f.close()
-    return chroms
 
-def readBedGraphFile(filename,chr='chr1'):
+def readGenomeSizes(filename):
+    """ Read a genome size file (e.g. UCSC hg19.chrom.sizes), with the name and size of a chromosome on each row.
+        Returns a dictionary with the size of each chromosome.
+    """
+    sizes = dict()
+    f = open(filename)
+    row = 0
+    for line in f:
+        row += 1
+        words = line.strip().split()
+        if len(words) == 0 or words[0].startswith('#'):
+            continue # ignore empty lines and comments
+        try:
+            sizes[words[0]] = int(words[1])
+        except (IndexError, ValueError):
+            f.close()
+            raise RuntimeError('Error in genome size file %s at row %d' % (filename, row))
+    f.close()
+    return sizes
+
+def readBedGraphFile(filename,chr='chr1', index = False):
     """ Read a Bedgraph file - suitable for large files.
+        Only the entries of chromosome chr are kept. With index, the chromosome is read directly from its block of the
+        file (see readBedGraphRegion), otherwise the file is scanned from the top.
     """
+    if index:
+        chroms = dict()
+        columns = readBedGraphRegion(filename, chr)
+        if columns != None:
+            tree = ival.IntervalTree()
+            chroms[chr] = tree
+            for entry in columns:
+                tree.put(ival.Interval(entry.chromStart, entry.chromEnd), entry)
+        return chroms
     f = open(filename)
     row = 0
     acceptHeaderRows = 1
@@ -464,6 +1337,8 @@ def readBedGraphFile(filename,chr='chr1'):
         words = line.strip().split()
         if len(words) == 0:
             continue # ignore empty lines
+        if words[0].startswith(('#', 'browser', 'track')):
+            continue # header rows
         try:
             chrom = str(words[0])
             if chrom == chr:
@@ -471,14 +1346,13 @@ def readBedGraphFile(filename,chr='chr1'):
                     tree = ival.IntervalTree()
                     chroms[chrom] = tree
                     found = True
-                else:
-                    chromStart = int(words[1])
-                    chromEnd = int(words[2])
-                    entry = BedEntry(chrom, chromStart, chromEnd)
-                    entry.addOption(score = float(words[3]))
-                    # put the entry in the interval tree for the appropriate chromosome
-                    iv = ival.Interval(entry.chromStart, entry.chromEnd)
-                    tree.put(iv, entry)
+                chromStart = int(words[1])
+                chromEnd = int(words[2])
+                entry = BedEntry(chrom, chromStart, chromEnd)
+                entry.addOption(score = float(words[3]))
+                # put the entry in the interval tree for the appropriate chromosome
+                iv = ival.Interval(entry.chromStart, entry.chromEnd)
+                tree.put(iv, entry)
             elif found: # no more entries
                 break
 
@@ -491,6 +1365,153 @@ def readBedGraphFile(filename,chr='chr1'):
     f.close()
     return chroms
 
+def bedGraphIndexFilename(filename):
+    """ Name of the binary sidecar file that holds the index of bedGraph file filename (see indexBedGraph). """
+    return filename + '.bgi.npz'
+
+def indexBedGraph(filename, binsize = 1 << 12, chunksize = 1 << 26, save = True):
+    """ Index a bedGraph file by the byte offsets of its rows, so that a chromosome or a region can be read
+        without reading what comes before it (see readBedGraphRegion).
+        The rows of each chromosome need to be together and sorted by chromStart (e.g. sort -k1,1 -k2,2n),
+        a RuntimeError is raised otherwise. The rows are read in chunks of about chunksize bytes and grouped
+        in bins of up to binsize rows, keeping for each bin the offset, chromStart and highest chromEnd of its rows.
+        save: write the index to its sidecar file (see bedGraphIndexFilename), if the directory is writable
+        Returns the index, a dictionary of arrays:
+        'chroms': the chromosome names, in file order
+        'chromoffsets': the offset of the first row of each chromosome, and the end of the last row
+        'binchroms', 'binoffsets', 'binstarts', 'binmaxends': chromosome (index into chroms), offset, lowest chromStart
+        and highest chromEnd of each bin
+    """
+    names = []
+    codes = dict() # index of each name
+    chromoffsets = []
+    bins = [] # (binchroms, binoffsets, binstarts, binmaxends) of each chunk
+    last = None # chromosome and chromStart of the previous row
+    f = open(filename, 'rb')
+    offset = 0
+    try:
+        while True:
+            lines = f.readlines(chunksize)
+            if not lines:
+                break
+            lengths = np.array([len(line) for line in lines], dtype = np.int64)
+            lineoffsets = offset + np.cumsum(lengths) - lengths
+            offset += int(np.sum(lengths))
+            text = b''.join(lines)
+            words = text.split()
+            if len(words) != 4 * len(lines) or b'#' in text or b'browser' in text or b'track' in text: # header or empty lines
+                keep = [i for i in range(len(lines)) if lines[i].strip() and not lines[i].lstrip().startswith((b'#', b'browser', b'track'))]
+                lines = [lines[i] for i in keep]
+                lineoffsets = lineoffsets[keep]
+                words = b''.join(lines).split()
+                if len(words) != 4 * len(lines):
+                    raise RuntimeError('bedGraph file %s has rows without 4 columns' % filename)
+            if not lines:
+                continue
+            chroms = np.array(words[0::4]).astype(str)
+            starts = np.array(words[1::4], dtype = np.int64)
+            ends = np.array(words[2::4], dtype = np.int64)
+            newchrom = np.concatenate(([last == None or last[0] != chroms[0]], chroms[1:] != chroms[:-1]))
+            for i in np.flatnonzero(newchrom):
+                if str(chroms[i]) in codes:
+                    raise RuntimeError('bedGraph file %s is not sorted by chromosome (%s)' % (filename, chroms[i]))
+                codes[str(chroms[i])] = len(names)
+                names.append(str(chroms[i]))
+                chromoffsets.append(int(lineoffsets[i]))
+            previous = np.concatenate(([last[1] if last != None and not newchrom[0] else starts[0]], starts[:-1]))
+            if np.any((starts < previous) & ~newchrom):
+                raise RuntimeError('bedGraph file %s is not sorted by chromStart' % filename)
+            first = newchrom | (np.arange(len(starts)) % binsize == 0) # rows that start a bin
+            at = np.flatnonzero(first)
+            bins.append((np.array([codes[chrom] for chrom in chroms[at].tolist()], dtype = np.int64),
+                         lineoffsets[at], starts[at], np.maximum.reduceat(ends, at)))
+            last = (str(chroms[-1]), int(starts[-1]))
+    finally:
+        f.close()
+    chromoffsets.append(offset)
+    index = dict()
+    index['chroms'] = np.array(names, dtype = str)
+    index['chromoffsets'] = np.array(chromoffsets, dtype = np.int64)
+    for i, key in enumerate(('binchroms', 'binoffsets', 'binstarts', 'binmaxends')):
+        index[key] = np.concatenate([chunk[i] for chunk in bins] + [np.zeros(0, dtype = np.int64)])
+    if save:
+        arrays = dict(index)
+        arrays['key'] = np.array(bedCacheKey(filename, 'BedGraph'))
+        saveArrays(bedGraphIndexFilename(filename), arrays)
+    return index
+
+def loadBedGraphIndex(filename):
+    """ Load the index of a bedGraph file from its sidecar file (see indexBedGraph).
+        Returns None if there is no (up-to-date) index file.
+    """
+    indexname = bedGraphIndexFilename(filename)
+    if not os.path.exists(indexname):
+        return None
+    try:
+        arrays = np.load(indexname, allow_pickle = False)
+        if str(arrays['key']) != bedCacheKey(filename, 'BedGraph'):
+            return None
+        return dict([(key, arrays[key]) for key in ('chroms', 'chromoffsets', 'binchroms', 'binoffsets', 'binstarts', 'binmaxends')])
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return None
+
+bedGraphIndexes = dict() # indexes built or loaded by getBedGraphIndex, by bedCacheKey
+
+def getBedGraphIndex(filename, save = True):
+    """ The index of a bedGraph file (see indexBedGraph), kept in memory while the file is unchanged once it is built
+        or loaded, so that reading further chromosomes or regions of the file does not scan it again.
+        save: load the index from, and write it to, its sidecar file (see bedGraphIndexFilename)
+    """
+    key = bedCacheKey(filename, 'BedGraph')
+    if key not in bedGraphIndexes:
+        index = loadBedGraphIndex(filename) if save else None
+        if index == None:
+            index = indexBedGraph(filename, save = save)
+        bedGraphIndexes[key] = index
+    return bedGraphIndexes[key]
+
+def readBedGraphRegion(filename, chrom, start = None, end = None, index = None):
+    """ Read the entries of a bedGraph file on one chromosome, or those overlapping [start, end) of it.
+        Only the bytes of the bins that can hold those entries are read, through mmap.
+        index: the index of the file (see indexBedGraph), from getBedGraphIndex if not given
+        Returns BedColumns with the value of each entry as field 'score', or None if the chromosome has no entries.
+    """
+    if index == None:
+        index = getBedGraphIndex(filename)
+    names = index['chroms'].tolist()
+    if chrom not in names:
+        return None
+    c = names.index(chrom)
+    lo = int(index['chromoffsets'][c])
+    hi = int(index['chromoffsets'][c + 1])
+    inchrom = np.flatnonzero(index['binchroms'] == c)
+    binoffsets = index['binoffsets'][inchrom]
+    if start != None: # skip the bins that end before start
+        first = np.searchsorted(np.maximum.accumulate(index['binmaxends'][inchrom]), start, side = 'right')
+        lo = int(binoffsets[first]) if first < len(inchrom) else hi
+    if end != None: # and those that start at or after end
+        last = np.searchsorted(index['binstarts'][inchrom], end, side = 'left')
+        hi = int(binoffsets[last]) if last < len(inchrom) else hi
+    words = []
+    if hi > lo:
+        f = open(filename, 'rb')
+        try:
+            with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+                words = mm[lo:hi].split()
+        finally:
+            f.close()
+    if len(words) % 4 != 0:
+        raise RuntimeError('bedGraph file %s has rows without 4 columns' % filename)
+    starts = np.array(words[1::4], dtype = np.int64)
+    ends = np.array(words[2::4], dtype = np.int64)
+    scores = np.array(words[3::4], dtype = np.float64)
+    keep = np.ones(len(starts), dtype = bool)
+    if start != None:
+        keep &= ends > start
+    if end != None:
+        keep &= starts < end
+    return BedColumns(chrom, starts[keep], ends[keep], {'score': scores[keep]})
+
 def writeBedFile(entries, filename, format = 'BED6', header = None):
     """ Save the BED entries to a BED file.
         format - the format to use for WRITING, currently only BED6 ('Optional' 6-col format) is supported.
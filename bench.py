@@ -0,0 +1,321 @@
+'''
+Benchmarks of the ROC pipeline on seeded synthetic data, and checks that its engines produce the same curves
+e.g. python bench.py --peaks 100000 --out bench.json
+'''
+import ROCCurve, ribbon, bed, instrument
+import os, sys, time, json, argparse, tempfile, itertools
+import numpy as np
+
+def write_peaks(filename,chroms,starts,ends,signal,pvalue):
+    '''
+    Writes peaks as a narrowPeak file (the ChIP-R output format, also readable as IDR output by bed.BedFile)
+    chroms, starts, ends, signal, pvalue <numpy.array> --> one value per peak, in file order
+    '''
+    with open(filename, 'w') as f:
+        rows = zip(chroms.tolist(), starts.tolist(), ends.tolist(), signal.tolist(), pvalue.tolist())
+        f.write(''.join('%s\t%d\t%d\t.\t%d\t.\t%.4f\t%.4f\t%.4f\t-1\n' % (chrom, start, end, min(int(p * 10), 1000), s, p, p / 2)
+                        for chrom, start, end, s, p in rows))
+
+def write_intervals(filename,intervals):
+    '''
+    Writes a dict {chrom: (starts, ends)} (e.g. from bed.BedFile.merged()) as a narrowPeak file, sorted by chromosome
+    '''
+    chroms = sorted(intervals.keys())
+    starts = np.concatenate([intervals[chrom][0] for chrom in chroms] + [np.zeros(0, dtype=np.int64)])
+    ends = np.concatenate([intervals[chrom][1] for chrom in chroms] + [np.zeros(0, dtype=np.int64)])
+    names = np.repeat(np.array(chroms, dtype=object), [len(intervals[chrom][0]) for chrom in chroms])
+    zeros = np.zeros(len(starts))
+    write_peaks(filename, names, starts, ends, zeros, zeros)
+
+def generate(root,peaks=10000,groups=('chipr','idr'),replicates=3,seed=0,nchroms=24):
+    '''
+    Writes a seeded synthetic data set in the folder layout of ROCCurve.main() under root (str)
+    peaks (int) --> number of peaks of the first group, which holds every peak (the largest test set); the other
+                    groups call about 60% of them
+    groups [str,str..] --> prefixes of the experimental groups, a group with 'idr' in its name ranks the highest
+                           pValue first, the others the lowest first
+    replicates (int) --> number of truth sets, each labelling the peaks of every group into TP, FP, TN and FN files
+    About 10% of the peaks overlap the one before, 5% touch it, and the scores are rounded so that values repeat, to
+    exercise the ranking of overlapping bases and ties; all files are sorted by chromosome and start (e.g. for --stream)
+    Returns dict {group: (test, [(TP, TN, FP, FN),..])} of (filename,formats)
+    '''
+    rng = np.random.default_rng(seed)
+    names = sorted('chr' + str(c + 1) for c in range(nchroms))
+    perchrom = rng.multinomial(peaks, np.ones(nchroms) / nchroms)
+    chroms = np.repeat(np.array(names, dtype=object), perchrom)
+    widths = rng.lognormal(5.5, 0.6, peaks).astype(np.int64) + 50 # about 250bp, with a long tail
+    gaps = rng.integers(100, 5000, peaks)
+    layout = rng.random(peaks)
+    overlaps = layout < 0.1
+    gaps[overlaps] = -(rng.random(int(overlaps.sum())) * np.roll(widths, 1)[overlaps] * 0.9).astype(np.int64) - 1 # into the peak before
+    gaps[(layout >= 0.1) & (layout < 0.15)] = 0 # touching the peak before
+    firsts = (np.cumsum(perchrom) - perchrom)[perchrom > 0]
+    gaps[firsts] = np.maximum(gaps[firsts], 100) # nothing before the first peak of a chromosome
+    starts = np.zeros(peaks, dtype=np.int64)
+    offset = 0
+    for n in perchrom: # positions restart on every chromosome
+        starts[offset:offset + n] = np.cumsum(gaps[offset:offset + n] + widths[offset:offset + n]) - widths[offset:offset + n]
+        offset += n
+    ends = starts + widths
+    quality = rng.random(peaks) # hidden quality of each peak, scores and truth both follow it
+    signal = np.round(1 + 19 * quality + rng.normal(0, 2, peaks).clip(-1, 1), 4)
+
+    truths = [] # per replicate, the true regions: part of the better peaks
+    for r in range(replicates):
+        true = rng.random(peaks) < 0.2 + 0.6 * quality
+        lo = starts + (rng.random(peaks) * widths * 0.5).astype(np.int64)
+        hi = np.minimum(lo + 1 + (rng.random(peaks) * widths).astype(np.int64), ends)
+        truths.append(bed.BedFile.fromIntervals(dict([(chrom, (lo[true & (chroms == chrom)], hi[true & (chroms == chrom)])) for chrom in names])))
+
+    for subdir in ('True_Positives', 'False_Positives', 'True_Negatives', 'False_Negatives', 'Test_data'):
+        os.makedirs(os.path.join(root, subdir), exist_ok=True)
+    out = dict()
+    universe = None
+    for g, group in enumerate(groups):
+        called = np.ones(peaks, dtype=bool) if g == 0 else rng.random(peaks) < 0.6
+        noise = rng.normal(0, 0.15, peaks)
+        if 'idr' in group.lower():
+            pvalue = np.round(50 * (quality + noise).clip(0, None), 1) # best first
+        else:
+            pvalue = np.round(50 * (1 - quality + noise).clip(0, None), 1) # lowest first
+        testname = os.path.join(root, 'Test_data', group + '.bed')
+        write_peaks(testname, chroms[called], starts[called], ends[called], signal[called], pvalue[called])
+        test = bed.BedFile(testname, 'Peaks', backend='columnar')
+        if universe is None:
+            universe = test
+        formats = ('idr',) if 'idr' in group.lower() else ('Peaks',)
+        out[group] = ((testname, ('Peaks', 'idr')), [])
+        for r in range(replicates):
+            parts = ROCCurve.label_partitions(test, truths[r], universe)
+            files = []
+            for subdir, part in zip(('True_Positives', 'True_Negatives', 'False_Positives', 'False_Negatives'), parts):
+                filename = os.path.join(root, subdir, group + '_' + str(r + 1) + '.bed')
+                write_intervals(filename, part.merged())
+                files.append((filename, formats))
+            out[group][1].append(tuple(files))
+    return out
+
+def largest(data):
+    '''
+    Returns (filename,formats) of the largest test set of data (from generate()), i.e. the one labelling every base
+    '''
+    return max((data[group][0] for group in data), key=lambda testfile: os.path.getsize(testfile[0]))
+
+class Stages:
+    '''
+    Times stages of a benchmark, see run()
+    '''
+    def __init__(self):
+        self.records = []
+
+    def time(self,name,items,function,*args,**kwargs):
+        '''
+        Calls function(*args,**kwargs) and records its wall and CPU time, items (int) handled and the peak RSS reached
+        in it (see instrument.PeakMemory)
+        Returns what function returns
+        '''
+        with instrument.PeakMemory() as memory:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            result = function(*args, **kwargs)
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+        self.records.append({'stage': name, 'seconds': round(wall, 6), 'cpu_seconds': round(cpu, 6), 'items': int(items),
+                             'items_per_second': round(items / wall, 1) if wall > 0 else None,
+                             'peak_rss_kb': memory.kb, 'peak_scope': memory.scope})
+        return result
+
+    def skip(self,name,reason):
+        self.records.append({'stage': name, 'skipped': reason})
+
+def run(data,root,precise_limit=50000000,sample=10000):
+    '''
+    Times the stages of the pipeline on the first replicate of every group of data (from generate())
+    precise_limit (int) --> the precise base level curve (one point per base) is left out above this many bases
+    sample (int) --> number of test entries queried one by one with bed.BedFile.getOverlap() and getClosest()
+    Returns the records of Stages
+    '''
+    stages = Stages()
+    universe = bed.BedFile(largest(data)[0], 'Peaks')
+    for group in sorted(data.keys()):
+        testfile, replicates = data[group]
+        partition = replicates[0]
+        with open(testfile[0]) as f:
+            rows = sum(1 for line in f)
+        stages.time(group + ': readBedFile', rows, bed.readBedFile, testfile[0], 'Peaks')
+        test = bed.BedFile(testfile[0], 'Peaks')
+        TP, TN, FP, FN = [bed.BedFile(filename, formats[0]) for filename, formats in partition]
+        entries = [entry for i, entry in zip(range(sample), test)]
+        stages.time(group + ': BedFile.getOverlap', len(entries), lambda: [TP.getOverlap(entry) for entry in entries])
+        stages.time(group + ': BedFile.getClosest', len(entries), lambda: [TP.getClosest(entry) for entry in entries])
+        stages.time(group + ': BedFile.closestMany', rows, TP.closestMany, test)
+        bases = stages.time(group + ': total_bases', 5, lambda: [ROCCurve.total_bases(bfile) for bfile in (TP, TN, FP, FN, test)])
+        stages.time(group + ': get_points_to_plot peak', rows, ROCCurve.get_points_to_plot, TP, TN, FP, FN, test, universe, group, bybase=False)
+        points = stages.time(group + ': get_points_to_plot base collapsed', bases[4], ROCCurve.get_points_to_plot, TP, TN, FP, FN, test, universe, group, precise=False)
+        if sum(bases[:4]) <= precise_limit:
+            points = stages.time(group + ': get_points_to_plot base precise', bases[4], ROCCurve.get_points_to_plot, TP, TN, FP, FN, test, universe, group, precise=True)
+        else:
+            stages.skip(group + ': get_points_to_plot base precise', 'more than %d bases' % precise_limit)
+        name = os.path.join(root, group + '_bench')
+        stages.time(group + ': save_csv', len(points[0]), ROCCurve.save_csv, name, points)
+        stages.time(group + ': ribbon.parse', len(points[0]), ribbon.parse, name + '.csv')
+        stages.time(group + ': save_npy', len(points[0]), ROCCurve.save_npy, name, points)
+        stages.time(group + ': ribbon.parse_npy', len(points[0]), ribbon.parse_npy, name + '.npy')
+    return stages.records
+
+def reference_points(TP,TN,FP,FN,test,all,name2,bybase=True):
+    '''
+    Entry by entry reference for ROCCurve.get_points_to_plot(..., precise=False), looping over the entries of tree
+    backend bedfiles (bed.BedFile) and their bed.BedFile.getOverlap() like the original implementation did
+    The test entries are walked in ranking order (pValue, the highest first for IDR output). By base, each base goes
+    to the first test entry covering it and the FP bases of equal values come before their TP bases; by peak, each
+    entry is one step and the entries of all overlapping a TP or FN region are the positives
+    '''
+    each = lambda bfile: itertools.chain.from_iterable(bfile.generate(chrom) for chrom in sorted(bfile.chroms)) # also when empty
+    ascending = 'idr' not in name2.lower()
+    rank = lambda entry: entry.pValue if ascending else -entry.pValue
+    entries = sorted(each(test), key=lambda entry: (rank(entry), entry.chrom, entry.chromStart, entry.chromEnd))
+    xs, ys = [], []
+    xsum = ysum = 0
+    if not bybase:
+        positives = [bool(TP.getOverlap(entry) or FN.getOverlap(entry)) for entry in each(all)]
+        YDENOM = sum(positives)
+        XDENOM = len(positives) - YDENOM
+        for entry in entries:
+            if TP.getOverlap(entry):
+                ysum += 1
+            else:
+                xsum += 1
+            xs.append(xsum / XDENOM)
+            ys.append(ysum / YDENOM)
+        return np.array(xs), np.array(ys)
+
+    size = dict() # highest chromEnd of each chromosome, for one flag per base
+    for bfile in (TP, TN, FP, FN, test):
+        for entry in each(bfile):
+            size[entry.chrom] = max(size.get(entry.chrom, 0), entry.chromEnd)
+    def covered(*bfiles):
+        flags = dict((chrom, np.zeros(size[chrom], dtype=bool)) for chrom in size)
+        for bfile in bfiles:
+            for entry in each(bfile):
+                flags[entry.chrom][entry.chromStart:entry.chromEnd] = True
+        return sum(int(np.count_nonzero(flag)) for flag in flags.values())
+    def within(bfile,entry): # bases of entry covered by an entry of bfile
+        flags = np.zeros(entry.chromEnd - entry.chromStart, dtype=bool)
+        for region in bfile.getOverlap(entry) or []:
+            flags[max(region.chromStart - entry.chromStart, 0):region.chromEnd - entry.chromStart] = True
+        return flags
+    YDENOM = covered(TP, FN)
+    XDENOM = covered(FP, TN)
+    claimed = dict((chrom, np.zeros(size[chrom], dtype=bool)) for chrom in size) # bases of better ranked entries
+    for value, tied in itertools.groupby(entries, key=rank):
+        tps = fps = 0
+        for entry in tied:
+            new = ~claimed[entry.chrom][entry.chromStart:entry.chromEnd]
+            tps += int(np.count_nonzero(new & within(TP, entry)))
+            fps += int(np.count_nonzero(new & within(FP, entry)))
+            claimed[entry.chrom][entry.chromStart:entry.chromEnd] = True
+        if fps:
+            xsum += fps
+            xs.append(xsum / XDENOM)
+            ys.append(ysum / YDENOM)
+        if tps:
+            ysum += tps
+            xs.append(xsum / XDENOM)
+            ys.append(ysum / YDENOM)
+    return np.array(xs), np.array(ys)
+
+def same_curve(a,b):
+    '''
+    True if the curves a and b (xs, ys) are the same, compared by their vertices from the origin (see compress_points())
+    '''
+    a = ROCCurve.compress_points(np.concatenate(([0.0], a[0])), np.concatenate(([0.0], a[1])))
+    b = ROCCurve.compress_points(np.concatenate(([0.0], b[0])), np.concatenate(([0.0], b[1])))
+    return bool(np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1]))
+
+def same_closest(target,query):
+    '''
+    True if bed.BedFile.closestMany() finds an entry of target (bed.BedFile) as close as getClosest() does, for every
+    entry of query (bed.BedFile)
+    '''
+    for chrom, (qidx, hidx, distance) in target.closestMany(query, signed=False).items():
+        columns = query.columns(chrom)
+        for i, d in zip(qidx.tolist(), distance.tolist()):
+            nearest = target.getOneOfClosest(columns.entry(i))
+            if d != max(nearest.chromStart - int(columns.ends[i]), int(columns.starts[i]) - nearest.chromEnd, 0):
+                return False
+    return True
+
+def check(data,root,precise_limit=50000000,chromjobs=2):
+    '''
+    Checks that the engines give the same curves, on every replicate of every group of data (from generate()), and
+    the same curves as the entry by entry reference_points()
+    Returns dict {check: bool}
+    '''
+    checks = dict()
+    universefile = largest(data)
+    universe = ROCCurve.load_bed(*universefile)
+    for group in sorted(data.keys()):
+        testfile, replicates = data[group]
+        for r, partition in enumerate(replicates):
+            prefix = group + '_' + str(r + 1) + ': '
+            files = list(partition) + [testfile, universefile]
+            columnar = [ROCCurve.load_bed(filename, formats) for filename, formats in files]
+            tree = [bed.BedFile(filename, formats[0]) for filename, formats in files]
+            test = columnar[4]
+            checks[prefix + 'closestMany == getClosest'] = same_closest(columnar[0], test)
+            for bybase in (False, True):
+                level = ' base' if bybase else ' peak'
+                a = ROCCurve.get_points_to_plot(*columnar, group, bybase=bybase, precise=False)
+                b = ROCCurve.get_points_to_plot(*tree, group, bybase=bybase, precise=False)
+                checks[prefix + 'tree == columnar' + level] = same_curve(a, b)
+                checks[prefix + 'reference == columnar' + level] = same_curve(reference_points(*tree, group, bybase=bybase), a)
+                truth = ROCCurve.label_partitions(test, bed.BedFile.fromIntervals(columnar[0].union(columnar[3])), universe)
+                c = ROCCurve.get_points_to_plot(*truth, test, universe, group, bybase=bybase, precise=False)
+                checks[prefix + 'label_partitions == partition files' + level] = same_curve(a, c)
+            a = ROCCurve.get_points_to_plot(*columnar, group, precise=False)
+            b = ROCCurve.get_points_to_plot(*columnar, group, precise=False, jobs=chromjobs)
+            checks[prefix + 'serial == chromosome parallel'] = same_curve(a, b)
+            streamed = np.array(list(ROCCurve.stream_points_to_plot(*files[:5], group)), dtype=float).reshape(-1, 2).T
+            checks[prefix + 'in memory == streamed'] = same_curve(a, streamed)
+            if sum(ROCCurve.total_bases(bfile) for bfile in columnar[:4]) <= precise_limit:
+                c = ROCCurve.get_points_to_plot(*columnar, group, precise=True)
+                checks[prefix + 'precise == collapsed'] = same_curve(a, c)
+            name = os.path.join(root, group + '_check')
+            ROCCurve.save_csv(name, ROCCurve.compress_points(*a))
+            ROCCurve.save_npy(name, ROCCurve.compress_points(*a))
+            checks[prefix + 'csv == npy'] = same_curve(ribbon.parse(name + '.csv'), ribbon.parse_npy(name + '.npy'))
+    return checks
+
+def main(peaks=10000,replicates=3,seed=0,root=None,out=None,precise_limit=50000000,checks=True):
+    '''
+    Generates the data (in a temporary directory unless root (str) is given), runs the benchmark and the checks and
+    writes the report as JSON to out (str), or prints it
+    Returns True if every check passed
+    '''
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = root or tmpdir
+        wall = time.perf_counter()
+        data = generate(root, peaks, replicates=replicates, seed=seed)
+        report = {'peaks': peaks, 'replicates': replicates, 'seed': seed, 'generate_seconds': round(time.perf_counter() - wall, 3)}
+        report['stages'] = run(data, root, precise_limit)
+        report['checks'] = check(data, root, precise_limit) if checks else dict()
+    text = json.dumps(report, indent=1)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return all(report['checks'].values())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the ROC pipeline on seeded synthetic data and checks that its engines agree')
+    parser.add_argument('--peaks', type=int, default=10000, help='number of peaks of the largest test set (default 10000)')
+    parser.add_argument('--replicates', type=int, default=3, help='number of replicates per group (default 3)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generator (default 0)')
+    parser.add_argument('--root', help='directory to write the data to (default: a temporary directory)')
+    parser.add_argument('--out', help='JSON report file (default: printed)')
+    parser.add_argument('--precise-limit', type=int, default=50000000, help='leave out the one point per base curves above this many bases (default 50000000)')
+    parser.add_argument('--no-checks', action='store_true', help='only time the stages')
+    args = parser.parse_args()
+    sys.exit(0 if main(args.peaks, args.replicates, args.seed, args.root, args.out, args.precise_limit, not args.no_checks) else 1)
@@ -0,0 +1,159 @@
+'''
+Stage level instrumentation of the ROC pipeline
+Off unless the ROC_TRACE environment variable names a trace file, or enable() is called (ROCCurve.py --trace FILE)
+When on, every stage records its wall and CPU time, the items it handled and the peak memory reached inside it (see
+PeakMemory), and save() writes the records as a Chrome trace (chrome://tracing or https://ui.perfetto.dev) - one row per process
+When off, stage() hands out one shared context that does nothing
+'''
+import os, time, json
+
+tracefile = os.environ.get('ROC_TRACE') or None
+events = [] # the records of this process, as Chrome trace events
+
+def max_rss_kb():
+    '''
+    Peak memory of this process (int, kB on Linux), None where the resource module is not available (e.g. Windows)
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def rss_peak_kb():
+    '''
+    Peak resident memory (int, kB) of this process since it started or since the last reset_rss_peak(), from
+    /proc/self/status (Linux), None elsewhere
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+def reset_rss_peak():
+    '''
+    Restarts rss_peak_kb() from the current memory use, through /proc/self/clear_refs (Linux)
+    Returns False where that is not possible
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return rss_peak_kb() is not None
+
+peaks = [] # the peak memory (kB) reached so far in each open PeakMemory() of this process, innermost last
+
+class PeakMemory:
+    '''
+    Measures the peak memory reached inside a block: with PeakMemory() as peak: ..., then peak.kb (int, kB) and
+    peak.scope - 'stage' when the peak was reset on entry (see reset_rss_peak()), so that it is the peak of the block;
+    otherwise 'process', the peak of the process so far (max_rss_kb()), as on platforms without /proc
+    Blocks can be nested: a reset for an inner block keeps the peak reached so far by the outer blocks
+    '''
+    def __enter__(self):
+        if peaks:
+            peaks[-1] = max(peaks[-1], rss_peak_kb() or 0) # before the reset
+        self.scope = 'stage' if reset_rss_peak() else 'process'
+        peaks.append(0)
+        return self
+
+    def __exit__(self,*exc):
+        peak = peaks.pop()
+        if self.scope == 'stage':
+            self.kb = max(peak, rss_peak_kb() or 0)
+            if peaks:
+                peaks[-1] = max(peaks[-1], self.kb)
+        else:
+            self.kb = max_rss_kb()
+        return False
+
+class Stage:
+    '''
+    Context of one recorded stage, see stage() - set items (int) when the count is only known inside the stage
+    '''
+    def __init__(self,name,items=None,args=None):
+        self.name = name
+        self.items = items
+        self.args = args
+
+    def __enter__(self):
+        self.memory = PeakMemory().__enter__()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self,*exc):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.memory.__exit__(*exc)
+        args = dict(self.args) if self.args else dict()
+        args['cpu_ms'] = round((cpu - self.cpu) * 1000, 3)
+        args['peak_rss_kb'] = self.memory.kb
+        args['peak_scope'] = self.memory.scope
+        if self.items is not None:
+            args['items'] = int(self.items)
+        events.append({'name': self.name, 'cat': 'roc', 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                       'ts': round(self.wall * 1e6, 1), 'dur': round((wall - self.wall) * 1e6, 1), 'args': args})
+        return False
+
+class Off:
+    '''
+    Context of stage() when instrumentation is off
+    '''
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+off = Off()
+
+def stage(name,items=None,**args):
+    '''
+    Context manager recording one stage, e.g. with instrument.stage('parse', file=filename) as s: ... s.items = n
+    name (str) --> name of the stage
+    items (int) --> number of items handled (e.g. entries or points), if known up front
+    args --> anything else to keep with the record (e.g. the group and replicate)
+    '''
+    if tracefile is None:
+        return off
+    return Stage(name, items, args)
+
+def enable(filename):
+    '''
+    Turns instrumentation on, for this process and the worker processes it starts, with the trace going to filename (str)
+    '''
+    global tracefile
+    tracefile = filename
+    os.environ['ROC_TRACE'] = filename
+
+def take_events():
+    '''
+    Returns the records of this process and forgets them - for worker processes to hand them to their parent
+    '''
+    taken = list(events)
+    del events[:]
+    return taken
+
+def add_events(more):
+    '''
+    Adds records taken from a worker process (see take_events())
+    '''
+    events.extend(more)
+
+def save(filename=None):
+    '''
+    Writes the records as a Chrome trace to filename (str), by default the trace file given to enable() or by ROC_TRACE
+    '''
+    filename = filename or tracefile
+    if filename is None:
+        return
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,97 @@
+'''
+Scalar summaries of ROC curves, for ranking runs without graphing them
+Curves are given as their vertices xs, ys (false and true positive rates), e.g. from
+ROCCurve.points_from_segments(segments,XDENOM,YDENOM,precise=False) or ribbon.parse_all(prefix) - the curve is
+linear between vertices, so collapsed runs of bases give the same values as one point per base
+Like ribbon.interpolate(), curves start at the origin and are not extended beyond their last point
+'''
+
+import numpy as np
+import csv, os
+import ribbon
+
+def curve(xs,ys):
+    '''
+    Returns the vertices x, y <numpy.array> of a curve with the origin in front
+    '''
+    x = np.concatenate(([0.0], np.asarray(xs, dtype=float)))
+    y = np.concatenate(([0.0], np.asarray(ys, dtype=float)))
+    return x, y
+
+def auc(xs,ys):
+    '''
+    Area under the curve xs, ys (float) --> trapezoids between the vertices
+    '''
+    x, y = curve(xs,ys)
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1])) / 2)
+
+def partial_auc(xs,ys,max_fpr):
+    '''
+    Area under the curve xs, ys up to the false positive rate max_fpr (float)
+    A curve ending before max_fpr only counts up to its last point
+    '''
+    x, y = curve(xs,ys)
+    inside = x < max_fpr
+    if inside.all():
+        return auc(xs,ys)
+    end = float(ribbon.interpolate(xs, ys, np.array([max_fpr]), side='left')[0]) # bottom of a vertical step at max_fpr
+    x = np.concatenate((x[inside], [max_fpr]))
+    y = np.concatenate((y[inside], [end]))
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1])) / 2)
+
+def tpr_at(xs,ys,fprs):
+    '''
+    True positive rates <numpy.array> of the curve xs, ys at each false positive rate of fprs [float,..]
+    The top of a vertical step is taken, NaN beyond the end of the curve
+    '''
+    return ribbon.interpolate(xs, ys, np.asarray(fprs, dtype=float), side='right')
+
+def replicate_metrics(parsed,max_fpr=0.1,fprs=(0.05,0.1)):
+    '''
+    Metrics of every replicate in parsed (output of ribbon.parse_all(prefix))
+    returns names [str,..] of the metrics and values <numpy.array> of shape (no. replicates, no. metrics)
+    '''
+    names = ['AUC', 'pAUC@'+str(max_fpr)] + ['TPR@'+str(fpr) for fpr in fprs]
+    values = np.empty((len(parsed), len(names)))
+    for r, (xs, ys) in enumerate(parsed):
+        values[r, 0] = auc(xs,ys)
+        values[r, 1] = partial_auc(xs,ys,max_fpr)
+        values[r, 2:] = tpr_at(xs,ys,fprs)
+    return names, values
+
+def bootstrap(values,n=1000,level=0.95,seed=0):
+    '''
+    Bootstrap confidence intervals of the mean over replicates
+    values <numpy.array> --> shape (no. replicates, no. metrics), e.g. from replicate_metrics()
+    n (int) --> number of resamples, all drawn at once
+    level (float) --> coverage of the percentile intervals
+    returns means, lows, highs <numpy.array> - one value per metric
+    '''
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, len(values), size=(n, len(values))) # replicate indices, one row per resample
+    means = np.nanmean(values[resamples], axis=1) # (n, no. metrics)
+    tail = (1 - level) / 2 * 100
+    return np.nanmean(values, axis=0), np.nanpercentile(means, tail, axis=0), np.nanpercentile(means, 100 - tail, axis=0)
+
+def save_metrics(prefixes,names,outdir='.',max_fpr=0.1,fprs=(0.05,0.1),n=1000,level=0.95,seed=0):
+    '''
+    Writes outdir/metrics.csv with the mean and bootstrap interval of each metric, per group and level
+    prefixes [str,..] --> prefixes of the experimental groups, whose outputs of ROCCurve.py are read from outdir
+    names [str,..] --> full names of the groups
+    Returns the rows written
+    '''
+    rows = [['group', 'level', 'metric', 'replicates', 'mean', 'low', 'high']]
+    for prefix, name in zip(prefixes, names):
+        for level_name, peaks in (('Peaks', True), ('Bases', False)):
+            parsed = ribbon.parse_all(os.path.join(outdir, str(prefix)), peaks=peaks)
+            if not parsed:
+                continue
+            metrics, values = replicate_metrics(parsed,max_fpr,fprs)
+            means, lows, highs = bootstrap(values,n,level,seed)
+            for m in range(len(metrics)):
+                rows.append([name, level_name, metrics[m], len(parsed), means[m], lows[m], highs[m]])
+    with open(os.path.join(outdir, 'metrics.csv'), 'w',newline='') as csvfile:
+        spamwriter = csv.writer(csvfile, delimiter=',',dialect='excel')
+        spamwriter.writerows(rows)
+    return rows
@@ -1,159 +1,206 @@
-import matplotlib.pyplot as plt
-import numpy as np
-import csv, sys
-
-def parse(e_file):
-    '''
-    Returns x<float> and y<float> coordinates [xs], [ys] from a given excel file as produced by ROCCurve.py - save_csv(name,points)
-    '''
-    xs =[]
-    ys =[]
-    if not 'base' in str(e_file):
-        with open(str(e_file), 'r',newline='') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
-            i = 0
-            for row in spamreader:
-                i+=1
-                if i %10 ==0:
-                    xs.append(float(row[0]))
-                    ys.append(float(row[1]))
-    else:
-        with open(str(e_file), 'r',newline='') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
-            i = 0
-            for row in spamreader:
-                i+=1
-                if i %100000 == 0:
-                    xs.append(float(row[0]))
-                    ys.append(float(row[1]))                        
-    return xs,ys
-
-def parse_all(prefix, peaks=True):
-    '''
-    Parses all files with a given prefix <str> in one batch
-    peaks(bool) - True if parsing peak output files
-    return: all [([<float>,<float>,..],[<float>,<float>,..]),([<float>,<float>,..],[<float>,<float>,..])...]
-    '''
-    all = []
-    i = 0
-
-    while True:
-        if peaks:
-            try:
-                file = prefix+'_'+str(i)+'Peaks.csv'       
-                all.append(parse(file))
-                i+=1
-            except:
-                break
-        else:
-            try:
-                file = prefix+'_'+str(i)+'Bases.csv'       
-                all.append(parse(file))
-                i+=1
-            except:
-                break
-
-    return all
-
-def get_averages_and_errors(parsed):
-    '''
-    Averaging function for combining replicates of the same run
-    parsed <list> - output of parse_all(prefix)
-    returns:
-    Xs <[float,float,..]> horizontal steps to graph, either no. peaks or no. bases
-    average_Ys <[float,float,..]> corresponding mean values 
-    high_bounds <[float,float,..]> corresponding maximum y value for each x value
-    low_bounds <[float,float,..]> corresponding maximum x value for each y value
-    '''
-    Xs = []
-    average_Ys = []
-    high_bounds = []
-    low_bounds = []
-
-    replicates = len(parsed)
-
-    for i in range(len(parsed[0][0])):
-        Xs.append(parsed[0][0][i])
-        sumy = 0
-        low = 1
-        high = 0
-        for y in range(replicates):
-            pointy = parsed[y][1][i]
-            sumy+=pointy
-            if pointy < low:
-                low = pointy
-            if pointy > high:
-                high = pointy
-
-        average_Ys.append(sumy/replicates)
-        low_bounds.append(low)
-        high_bounds.append(high)
-    
-    return Xs, average_Ys, high_bounds, low_bounds
-
-
-def make_arrays(xs,average,low_bounds,high_bounds):
-    '''
-    Transforms output of get_averages_and_errors(parsed) from lists to numpy arrays for use in ribbon(args,names)
-    '''
-    x = np.array(xs, dtype=float)
-    y = np.array(average, dtype=float)
-    low =  np.array(low_bounds, dtype=float)
-    high = np.array(high_bounds, dtype=float)
-
-    return x,y,low,high
-
-def ribbon(args,names):
-    '''
-    Graphs ROC curves (ribbon plots) 
-    args [<str>,<str>,..] the prefixes of each experimental group
-    names [<str>,<str>,..] the full names of each experimental group to display
-    '''
-    averages = []
-
-    # Peaks
-    
-    for arg in args:
-        to_plot = parse_all(str(arg),peaks=True)
-        averages.append(get_averages_and_errors(to_plot))
-    
-    print('Graphing at peak level')
-    fig, ax = plt.subplots()
-    ax.set_ylabel('True Positive Rate (Sensitivity)')
-    ax.set_xlabel('False Positive Rate (1 - Specificity)')
-    for group in averages:
-        x,y,low,high = make_arrays(group[0], group[1],group[2],group[3])
-        ax.plot(x, y, '-')
-        ax.fill_between(x, high, low, alpha=0.2)
-    
-    title = input('Please set a title for the graph - at the Peak Level')
-    ax.set_title(title)
-    fig.canvas.set_window_title(title)
-    plt.legend(names)
-    plt.show()
-    
-    # Bases
-
-    averages = []
-
-    print('Graphing at base level')
-    for arg in args:
-        to_plot = parse_all(str(arg),peaks=False)
-        averages.append(get_averages_and_errors(to_plot))
-
-
-    fig, ax = plt.subplots()
-    ax.set_ylabel('True Positive Rate (Sensitivity)')
-    ax.set_xlabel('False Positive Rate (1 - Specificity)')
-    for group in averages:
-        x,y,low,high = make_arrays(group[0], group[1],group[2],group[3])
-        ax.plot(x, y, '-')
-        ax.fill_between(x, high, low, alpha=0.2)
-    
-    title = input('Please set a title for the graph at the Base Level')
-    ax.set_title(title)
-    fig.canvas.set_window_title(title)
-    plt.legend(names)
-
-    plt.show()
-  
+import numpy as np
+import csv, sys, os
+
+def parse(e_file):
+    '''
+    Returns x<float> and y<float> coordinates [xs], [ys] from a given excel file as produced by ROCCurve.py - save_csv(name,points)
+    Every row is read, but only the vertices of the curve are kept: a point in the middle of a straight run (e.g. a per base
+    run of TPs) is dropped, so the curve is exact while staying small
+    '''
+    xs =[]
+    ys =[]
+    with open(str(e_file), 'r',newline='') as csvfile:
+        spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
+        for row in spamreader:
+            x = float(row[0])
+            y = float(row[1])
+            if xs and x == xs[-1] and y == ys[-1]:
+                continue # repeated point
+            if len(xs) > 1 and (xs[-1] - xs[-2]) * (y - ys[-1]) == (ys[-1] - ys[-2]) * (x - xs[-1]):
+                xs[-1] = x # same direction, move the end of the run
+                ys[-1] = y
+            else:
+                xs.append(x)
+                ys.append(y)
+    return xs,ys
+
+def compress(xs,ys):
+    '''
+    Returns the vertices xs, ys <numpy.array> of a curve given as arrays of points, as kept by parse(e_file)
+    '''
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if len(xs) == 0:
+        return xs, ys
+    moved = np.concatenate(([True], (np.diff(xs) != 0) | (np.diff(ys) != 0))) # drop repeated points
+    xs = xs[moved]
+    ys = ys[moved]
+    dx = np.diff(xs)
+    dy = np.diff(ys)
+    turns = dx[:-1] * dy[1:] != dy[:-1] * dx[1:]
+    keep = np.concatenate(([True], turns, [True])) if len(xs) > 1 else np.ones(len(xs), dtype=bool)
+    return xs[keep], ys[keep]
+
+def parse_npy(n_file):
+    '''
+    Binary version of parse(e_file), for a .npy file as produced by ROCCurve.py - save_npy(name,points)
+    The file holds one float64 array of shape (2, no. points), xs then ys, and is memory-mapped rather than read row by row
+    '''
+    points = np.load(str(n_file), mmap_mode='r')
+    return compress(points[0], points[1])
+
+def parse_all(prefix, peaks=True):
+    '''
+    Parses all files with a given prefix <str> in one batch
+    peaks(bool) - True if parsing peak output files
+    Each replicate is read from its .npy file if there is one, from its .csv file otherwise
+    return: all [([<float>,<float>,..],[<float>,<float>,..]),([<float>,<float>,..],[<float>,<float>,..])...]
+    '''
+    all = []
+    i = 0
+    level = 'Peaks' if peaks else 'Bases'
+
+    while True:
+        file = prefix+'_'+str(i)+level
+        try:
+            if os.path.exists(file+'.npy'):
+                all.append(parse_npy(file+'.npy'))
+            else:
+                all.append(parse(file+'.csv'))
+            i+=1
+        except:
+            break
+
+    return all
+
+def interpolate(xs,ys,grid,side='right'):
+    '''
+    Returns the y values <numpy.array> of one curve (xs, ys as from parse(e_file)) at each x value of grid <numpy.array>
+    Curves start at the origin and are linear between their points, beyond the last point of the curve the value is NaN
+    side <str> - 'right' takes the top of vertical steps, 'left' the bottom (the limit from the left)
+    '''
+    x = np.concatenate(([0.0], np.asarray(xs, dtype=float)))
+    y = np.concatenate(([0.0], np.asarray(ys, dtype=float)))
+    j = np.maximum(np.searchsorted(x, grid, side=side) - 1, 0) # last point before (or at, for side='right') each grid value
+    following = np.minimum(j + 1, len(x) - 1)
+    span = x[following] - x[j]
+    fraction = np.where(span > 0, (grid - x[j]) / np.where(span > 0, span, 1), 0)
+    out = y[j] + np.clip(fraction, 0, 1) * (y[following] - y[j])
+    out[grid > x[-1]] = np.nan
+    return out
+
+def get_averages_and_errors(parsed,grid=None,percentiles=None):
+    '''
+    Averaging function for combining replicates of the same run
+    Every replicate is interpolated onto a common grid of x values first, so replicates can have any number of points
+    parsed <list> - output of parse_all(prefix)
+    grid <[float,float,..]> - x values to average at, by default 0 and every x value of every replicate
+    percentiles <(float,float)> - e.g. (25,75) to report these percentiles as the bounds instead of the min and max
+    returns:
+    Xs <numpy.array> horizontal steps to graph, either no. peaks or no. bases
+    average_Ys <numpy.array> corresponding mean values 
+    high_bounds <numpy.array> corresponding maximum (or upper percentile) y value for each x value
+    low_bounds <numpy.array> corresponding minimum (or lower percentile) y value for each x value
+    Every grid value appears twice in Xs, for the bottom and the top of vertical steps. Replicates that end before
+    an x value are left out of the values at that x
+    '''
+    if not parsed:
+        raise ValueError('No replicates to average')
+    if grid is None:
+        grid = np.unique(np.concatenate([[0.0]] + [np.asarray(xs, dtype=float) for xs, ys in parsed]))
+    grid = np.asarray(grid, dtype=float)
+    Xs = np.repeat(grid, 2)
+    Ys = np.empty((len(parsed), len(Xs))) # one row per replicate
+    for r in range(len(parsed)):
+        Ys[r, 0::2] = interpolate(parsed[r][0], parsed[r][1], grid, side='left')
+        Ys[r, 1::2] = interpolate(parsed[r][0], parsed[r][1], grid, side='right')
+
+    average_Ys = np.nanmean(Ys, axis=0)
+    if percentiles is None:
+        low_bounds = np.nanmin(Ys, axis=0)
+        high_bounds = np.nanmax(Ys, axis=0)
+    else:
+        low_bounds = np.nanpercentile(Ys, percentiles[0], axis=0)
+        high_bounds = np.nanpercentile(Ys, percentiles[1], axis=0)
+
+    return Xs, average_Ys, high_bounds, low_bounds
+
+
+def make_arrays(xs,average,low_bounds,high_bounds):
+    '''
+    Transforms output of get_averages_and_errors(parsed) from lists to numpy arrays for use in ribbon(args,names)
+    '''
+    x = np.array(xs, dtype=float)
+    y = np.array(average, dtype=float)
+    low =  np.array(low_bounds, dtype=float)
+    high = np.array(high_bounds, dtype=float)
+
+    return x,y,low,high
+
+def graph(averages,names,title,filename=None):
+    '''
+    Draws one ribbon plot of the averaged curves (get_averages_and_errors(parsed) of each experimental group)
+    names [<str>,<str>,..] the full names of each experimental group to display
+    filename <str> saves the graph to this file (format from its extension) instead of showing it
+    '''
+    import matplotlib.pyplot as plt # only when graphing, so parsing (e.g. metrics.py) does not need matplotlib
+    fig, ax = plt.subplots()
+    ax.set_ylabel('True Positive Rate (Sensitivity)')
+    ax.set_xlabel('False Positive Rate (1 - Specificity)')
+    for group, name in zip(averages, names):
+        x,y,low,high = make_arrays(group[0], group[1],group[2],group[3])
+        ax.plot(x, y, '-', label=name)
+        ax.fill_between(x, high, low, alpha=0.2)
+    
+    ax.set_title(title)
+    if fig.canvas.manager is not None:
+        fig.canvas.manager.set_window_title(title)
+    ax.legend()
+    if filename:
+        fig.savefig(filename)
+        plt.close(fig)
+    else:
+        plt.show()
+
+def ribbon(args,names,titles=None,outdir='.',fmt=None):
+    '''
+    Graphs ROC curves (ribbon plots) 
+    args [<str>,<str>,..] the prefixes of each experimental group
+    names [<str>,<str>,..] the full names of each experimental group to display
+    titles (<str>,<str>) the titles of the peak and base level graphs, asked for when not given
+    outdir <str> the directory holding the .csv (or .npy) files of ROCCurve.py, graphs are saved there too
+    fmt <str> e.g. 'png', 'svg' or 'pdf' - saves the graphs as ROC_Peaks.<fmt> and ROC_Bases.<fmt> without a display,
+    instead of showing them
+    '''
+    if fmt:
+        import matplotlib.pyplot as plt
+        plt.switch_backend('Agg') # headless
+
+    # Peaks
+
+    averages = []
+    for arg in args:
+        to_plot = parse_all(os.path.join(outdir, str(arg)),peaks=True)
+        averages.append(get_averages_and_errors(to_plot))
+    
+    print('Graphing at peak level')
+    if titles:
+        title = titles[0]
+    else:
+        title = input('Please set a title for the graph - at the Peak Level')
+    graph(averages, names, title, os.path.join(outdir, 'ROC_Peaks.'+fmt) if fmt else None)
+    
+    # Bases
+
+    averages = []
+
+    print('Graphing at base level')
+    for arg in args:
+        to_plot = parse_all(os.path.join(outdir, str(arg)),peaks=False)
+        averages.append(get_averages_and_errors(to_plot))
+
+    if titles:
+        title = titles[1]
+    else:
+        title = input('Please set a title for the graph at the Base Level')
+    graph(averages, names, title, os.path.join(outdir, 'ROC_Bases.'+fmt) if fmt else None)